@@ -0,0 +1,2332 @@
+"""
+Gradient descent for linear regression : GDRegressor and what it is built from,
+without the walk through of gradientdescent.py (which imports everything from here).
+
+Only NumPy is needed. sklearn, matplotlib, scipy and numba are imported by the
+helpers that use them, when they are used : benchmark and DatasetCache (sklearn),
+DescentPlot (matplotlib), backend="numba" (numba). A scipy.sparse X is recognized
+without importing scipy. So importing this module costs about as much as importing
+NumPy, also in every worker process of n_jobs and cross_validate.
+
+"""
+
+import copy
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+__all__ = ["GDRegressor", "VanillaGD", "Momentum", "Nesterov", "AdaGrad", "RMSProp", "Adam",
+           "gd_sweep", "DescentPlot", "Checkpoint", "benchmark", "cross_validate",
+           "DatasetCache"]
+
+
+def _issparse(X):
+    "True for a scipy.sparse matrix. scipy is not imported for this : no scipy, no sparse X"
+    sparse = sys.modules.get("scipy.sparse")
+    return sparse is not None and sparse.issparse(X)
+
+
+def _matvec(X, v, out):
+    "out = X @ v for a dense or a sparse (CSR/CSC) X"
+    if _issparse(X):
+        out[:] = X @ v
+    else:
+        np.dot(X, v, out=out)
+
+
+def _loss_slopes(X, y, theta, residual, slopes):
+    """
+    Write r = y - X @ m - b into `residual` and the loss slopes into `slopes`
+    (slopes[:-1] for m, slopes[-1] for b). theta is laid out the same way.
+    Returns the loss, sum(r**2).
+
+    For several targets y and r are (n_samples, n_targets) and theta is
+    (n_features + 1, n_targets), one column per target : X @ m and X.T @ r are then
+    matrix products, so X is still read twice per epoch whatever the number of targets.
+
+    X can be a scipy.sparse CSR or CSC matrix : b is never added to X as a column
+    of ones, so X @ m and X.T @ r are sparse products that cost O(nnz).
+
+    """
+    _matvec(X, theta[:-1], residual)
+    np.subtract(y, residual, out=residual)
+    residual -= theta[-1]
+    return _residual_loss_slopes(X, residual, slopes)
+
+
+# float32 sums are added up block by block into float64, this many rows at a time
+_BLOCK_ROWS = 16384
+
+
+def _residual_loss_slopes(X, residual, slopes):
+    "second half of _loss_slopes, for when the residual is already known"
+    _slopes_m(X, residual, slopes)
+    slopes[-1] = -2 * residual.sum(axis=0, dtype=np.float64)
+    # the loss comes for free from the residual we already have
+    return _dot64(residual, residual)
+
+
+def _slopes_m(X, residual, slopes):
+    "slopes[:-1] = -2 * X.T @ r, the slopes for m"
+    if _issparse(X):
+        # (for float32 the sum of each column's non-zeros is done by scipy in float32)
+        slopes[:-1] = X.T @ residual
+        slopes[:-1] *= -2
+    elif residual.dtype == np.float64:
+        # X.T @ r, written straight into the slope buffer for m
+        np.dot(X.T, residual, out=slopes[:-1])
+        slopes[:-1] *= -2
+    else:
+        # float32 : every block's product is float32, their sum is float64
+        total = np.zeros(slopes[:-1].shape)
+        for start in range(0, len(residual), _BLOCK_ROWS):
+            total += X[start:start + _BLOCK_ROWS].T @ residual[start:start + _BLOCK_ROWS]
+        slopes[:-1] = -2 * total
+
+
+def _dot64(a, b):
+    "sum(a * b) of two arrays of the same shape, added up in float64 even when they are float32"
+    a, b = np.ravel(a), np.ravel(b)
+    if a.dtype == np.float64:
+        return a @ b
+    return sum(float(a[start:start + _BLOCK_ROWS] @ b[start:start + _BLOCK_ROWS])
+               for start in range(0, len(a), _BLOCK_ROWS))
+
+
+"""
+Fused kernel (optional, needs numba)
+
+The NumPy version reads X twice per epoch (X @ m, then X.T @ r) and writes the
+residual out in between. With only a few features that is all memory traffic and
+no arithmetic. One loop over the rows can do both : compute r for a row while
+the row is in cache, add r * row into the slopes, and move on. Nothing of size
+n_samples is written at all. Python loops are far too slow for that, so the loop
+is compiled by numba the first time it is needed, and without numba the NumPy
+version is used.
+"""
+
+
+def _fused_loss_slopes(X, y, theta, slopes):
+    "loss and slopes in a single pass over the rows of a dense X, sums in float64"
+    n_samples, n_features = X.shape
+    total = np.zeros(n_features + 1)
+    loss = 0.0
+    for i in range(n_samples):
+        r = float(y[i]) - float(theta[n_features])
+        for j in range(n_features):
+            r -= float(X[i, j]) * float(theta[j])
+        loss += r * r
+        for j in range(n_features):
+            total[j] += r * float(X[i, j])
+        total[n_features] += r
+    for j in range(n_features + 1):
+        slopes[j] = -2 * total[j]
+    return loss
+
+
+_BACKENDS = ("auto", "numpy", "numba")
+_compiled = {}
+
+
+def _numba_loss_slopes():
+    "_fused_loss_slopes compiled by numba, None when numba is not installed"
+    if "numba" not in _compiled:
+        try:
+            import numba
+        except ImportError:
+            _compiled["numba"] = None
+        else:
+            _compiled["numba"] = numba.njit(cache=True)(_fused_loss_slopes)
+    return _compiled["numba"]
+
+
+def _loss_slopes_function(backend):
+    "a function with the arguments of _loss_slopes for backend 'auto', 'numpy' or 'numba'"
+    if backend not in _BACKENDS:
+        raise ValueError("backend must be one of %s, got %r" % (_BACKENDS, backend))
+    fused = None if backend == "numpy" else _numba_loss_slopes()
+    if fused is None:
+        if backend == "numba":
+            raise ImportError("backend='numba' needs numba, pip install numba or use backend='auto'")
+        return _loss_slopes
+
+    def loss_slopes(X, y, theta, residual, slopes):
+        if _issparse(X) or y.ndim > 1:
+            return _loss_slopes(X, y, theta, residual, slopes)
+        return fused(X, y, theta, slopes)
+
+    return loss_slopes
+
+
+def _batches(n_samples, batch_size, shuffle, rng):
+    """
+    Yield the rows of every batch, to index X and y with.
+
+    batch_size=None is full batch GD (one batch per epoch).
+    Without shuffle the batches are contiguous blocks of rows taken in order, as
+    slices, so X[s] and y[s] are views and never copies.
+    With shuffle the rows are permuted every epoch and the batches are consecutive
+    blocks of that permutation, so both which rows share a batch and the order of
+    the batches change from epoch to epoch. Each batch is an array of row numbers,
+    sorted so X[rows] reads X front to back (a memmap too); only the batch is copied.
+    With batch_size=1 this visits every row once in a random order (SGD).
+
+    """
+    if batch_size is None or batch_size >= n_samples:
+        yield slice(None)
+        return
+    if shuffle:
+        order = rng.permutation(n_samples)
+        for start in range(0, n_samples, batch_size):
+            yield np.sort(order[start:start + batch_size])
+    else:
+        for start in range(0, n_samples, batch_size):
+            yield slice(start, start + batch_size)
+
+
+def _float_dtype(X, dtype=None):
+    "dtype if given, else X's own dtype when it is float32 or float64, else float64"
+    if dtype is None:
+        dtype = getattr(X, "dtype", None)
+        if dtype not in (np.float32, np.float64):
+            dtype = np.float64
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError("dtype must be float32 or float64, got %s" % dtype)
+    return dtype
+
+
+def _target_shape(y_shape):
+    "(n_targets,) for a y of several columns, () for one target (y 1d or a single column)"
+    if len(y_shape) > 2:
+        raise ValueError("y must be 1d or 2d (n_samples, n_targets), got shape %s" % (y_shape,))
+    return tuple(y_shape[1:]) if len(y_shape) == 2 and y_shape[1] > 1 else ()
+
+
+def _check_X_y(X, y, dtype=None):
+    """
+    X (2d) and y (1d, or 2d for several targets) as arrays of one float dtype
+    (see _float_dtype), copies only when the dtype has to change, so float32 data
+    is never upcast. A y of a single column is made 1d.
+
+    """
+    dtype = _float_dtype(X, dtype)
+    if _issparse(X):
+        if X.format not in ("csr", "csc"):
+            X = X.tocsr()
+        X = X.astype(dtype, copy=False)
+    else:
+        X = np.asarray(X, dtype=dtype)
+    if X.ndim == 1:
+        X = X.reshape(-1, 1)  # a single feature passed as a flat array
+    y = np.asarray(y, dtype=dtype)
+    if not _target_shape(y.shape):
+        y = y.ravel()
+    if X.shape[0] != y.shape[0]:
+        raise ValueError("X has %d rows but y has %d" % (X.shape[0], y.shape[0]))
+    return X, y
+
+
+def _open_array(a):
+    "a path to a .npy file is opened with mmap_mode, so nothing is read until it is used"
+    if isinstance(a, (str, os.PathLike)):
+        return np.load(a, mmap_mode="r")
+    return a
+
+
+# rows per chunk for predict and score
+_PREDICT_ROWS = 65536
+
+
+def _sum_sq64(a):
+    "sum(a**2, axis=0), one per target for a 2d a, added up in float64 even when a is float32"
+    if a.dtype == np.float64:
+        return np.einsum("i...,i...->...", a, a)
+    return sum(np.einsum("i...,i...->...", block, block).astype(np.float64)
+               for block in (a[start:start + _BLOCK_ROWS] for start in range(0, len(a), _BLOCK_ROWS)))
+
+
+def _rows(v, a):
+    "v (one number per feature) shaped to multiply the rows of a : m, or one column of m per target"
+    return v.reshape((-1,) + (1,) * (np.ndim(a) - 1))
+
+
+def _iter_chunks(X, y, chunk_size):
+    "yield (X_chunk, y_chunk) slices of arrays or memmaps, chunk_size rows at a time"
+    for start in range(0, len(y), chunk_size):
+        yield X[start:start + chunk_size], y[start:start + chunk_size]
+
+
+class _SufficientStats:
+    """
+    For the squared loss the slopes only need
+
+    n, sum(X), sum(y), X.T @ X, X.T @ y   (and y @ y for the loss itself)
+
+    loss_slope_m = -2 * (X.T @ y - X.T @ X @ m - b * sum(X))
+    loss_slope_b = -2 * (sum(y) - sum(X) @ m - n * b)
+
+    so after one pass over the data (update can be called once per chunk)
+    every epoch costs O(n_features**2) and never touches X again.
+
+    For several targets (target_shape=(n_targets,)) sum(y), X.T @ y and y @ y
+    have one column or entry per target, X.T @ X is shared by all of them.
+
+    """
+
+    def __init__(self, n_features, target_shape=()):
+        self.n = 0
+        self.sum_X = np.zeros(n_features)
+        self.sum_y = np.zeros(target_shape)
+        self.XtX = np.zeros((n_features, n_features))
+        self.Xty = np.zeros((n_features,) + target_shape)
+        self.yty = np.zeros(target_shape)
+
+    def update(self, X, y):
+        "add one chunk of rows, the statistics are always float64"
+        if _issparse(X):
+            self.n += len(y)
+            self.sum_X += np.asarray(X.sum(axis=0, dtype=np.float64)).ravel()
+            self.sum_y += y.sum(axis=0, dtype=np.float64)
+            self.XtX += (X.T @ X).toarray()
+            self.Xty += X.T @ y
+            self.yty += _sum_sq64(y)
+            return self
+        self.n += len(y)
+        self.sum_X += X.sum(axis=0, dtype=np.float64)
+        self.sum_y += y.sum(axis=0, dtype=np.float64)
+        # float32 chunks are multiplied block by block, so each product stays short
+        step = len(y) if X.dtype == np.float64 else _BLOCK_ROWS
+        for start in range(0, len(y), max(step, 1)):
+            X_block, y_block = X[start:start + step], y[start:start + step]
+            self.XtX += X_block.T @ X_block
+            self.Xty += X_block.T @ y_block
+            self.yty += np.einsum("i...,i...->...", y_block, y_block)
+        return self
+
+    def _sq_errors(self, m, b, XtXm):
+        "sum((y - X @ m - b)**2) expanded, one per target"
+        return (self.yty - 2 * np.einsum("i...,i...->...", m, self.Xty) - 2 * b * self.sum_y
+                + np.einsum("i...,i...->...", m, XtXm) + 2 * b * (self.sum_X @ m)
+                + self.n * b * b)
+
+    def loss_slopes(self, theta, slopes):
+        "same as _loss_slopes(X, y, theta, ...) but from the statistics only"
+        m, b = theta[:-1], theta[-1]
+        XtXm = self.XtX @ m
+        slopes[:-1] = -2 * (self.Xty - XtXm - np.multiply.outer(self.sum_X, b))
+        slopes[-1] = -2 * (self.sum_y - self.sum_X @ m - self.n * b)
+        return float(np.sum(self._sq_errors(m, b, XtXm)))
+
+    def centered(self):
+        """
+        mean_X, mean_y and the statistics of the centered data : Xc.T @ Xc, Xc.T @ yc, yc @ yc.
+        With b = mean_y - mean_X @ m the loss is yc @ yc - 2 * m @ (Xc.T @ yc) + m @ (Xc.T @ Xc) @ m
+        """
+        if self.n == 0:
+            raise ValueError("no data : the statistics are empty")
+        mean_X = self.sum_X / self.n
+        mean_y = self.sum_y / self.n
+        cov_XX = self.XtX - self.n * np.outer(mean_X, mean_X)
+        cov_Xy = self.Xty - self.n * np.multiply.outer(mean_X, mean_y)
+        var_y = self.yty - self.n * mean_y * mean_y
+        return mean_X, mean_y, cov_XX, cov_Xy, var_y
+
+    def solve(self, alpha_l2=0.0):
+        """
+        Exact answer of the normal equations (what LinearRegression gives,
+        or Ridge(alpha_l2)). Solved on the centered statistics, which is better
+        conditioned than putting the column of ones for b into X.T @ X.
+
+        """
+        mean_X, mean_y, cov_XX, cov_Xy, _ = self.centered()
+        if alpha_l2:
+            cov_XX = cov_XX + alpha_l2 * np.eye(len(mean_X))
+        # lstsq solves for every target at once, one column of cov_Xy each
+        theta = np.empty((len(mean_X) + 1,) + np.shape(mean_y))
+        theta[:-1] = np.linalg.lstsq(cov_XX, cov_Xy, rcond=None)[0]
+        theta[-1] = mean_y - mean_X @ theta[:-1]
+        return theta
+
+    def curvature(self, direction):
+        "sum((X @ direction[:-1] + direction[-1])**2), see GDRegressor._line_search_step"
+        d_m, d_b = direction[:-1], direction[-1]
+        return (np.vdot(d_m, self.XtX @ d_m) + 2 * np.vdot(d_b, self.sum_X @ d_m)
+                + self.n * np.vdot(d_b, d_b))
+
+    def r2(self, theta):
+        "R^2 of theta = [m, b] on the rows these statistics were made from, averaged over the targets"
+        m, b = theta[:-1], theta[-1]
+        ss_res = self._sq_errors(m, b, self.XtX @ m)
+        ss_tot = self.yty - self.sum_y ** 2 / self.n
+        return float(np.mean(1 - ss_res / ss_tot))
+
+    def __add__(self, other):
+        "statistics of both sets of rows"
+        total = _SufficientStats(len(self.sum_X))
+        for name, value in vars(self).items():
+            setattr(total, name, value + getattr(other, name))
+        return total
+
+    def __sub__(self, other):
+        "statistics of these rows without the rows of other (which must be part of them)"
+        rest = _SufficientStats(len(self.sum_X))
+        for name, value in vars(self).items():
+            setattr(rest, name, value - getattr(other, name))
+        return rest
+
+
+class _Scaler:
+    """
+    mean and standard deviation of every feature, from one pass over the rows
+    (update can be called once per chunk, like _SufficientStats).
+
+    GD on the standardized features (X - mean) / scale does not need that copy of X :
+    their slopes and intercept are m' = m * scale and b' = b + mean @ m, so the
+    residual is still y - X @ m - b, and only the slopes are taken over to m', b'
+
+    slope_m' = (slope_m - mean * slope_b) / scale,  slope_b' = slope_b
+
+    Every feature then has the same scale, so one learning rate suits all of them.
+    With several targets the same mean and scale apply to every column of m.
+
+    """
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.mean = np.zeros(n_features)
+        self.sum_sq = np.zeros(n_features)  # sum of squared deviations from the mean
+
+    def _merge(self, n, mean, sum_sq):
+        "add the mean and sum_sq of n more rows (Chan et al.), no cancellation between chunks"
+        total = self.n + n
+        delta = mean - self.mean
+        self.sum_sq += sum_sq + delta * delta * (self.n * n / total)
+        self.mean += delta * (n / total)
+        self.n = total
+
+    def update(self, X):
+        "add one chunk of rows"
+        if _issparse(X):
+            n = X.shape[0]
+            mean = np.asarray(X.sum(axis=0, dtype=np.float64)).ravel() / n
+            sq = np.asarray(X.multiply(X).sum(axis=0, dtype=np.float64)).ravel()
+            self._merge(n, mean, np.maximum(sq - n * mean * mean, 0))
+            return self
+        # one block at a time, so the only temporary is a block of rows
+        for start in range(0, len(X), _BLOCK_ROWS):
+            block = X[start:start + _BLOCK_ROWS]
+            mean = block.mean(axis=0, dtype=np.float64)
+            deviation = block - mean
+            self._merge(len(block), mean, np.einsum("ij,ij->j", deviation, deviation))
+        return self
+
+    @classmethod
+    def from_stats(cls, stats):
+        "the same numbers from _SufficientStats, without reading the data again"
+        scaler = cls(len(stats.sum_X))
+        scaler.n = stats.n
+        scaler.mean = stats.sum_X / stats.n
+        scaler.sum_sq = np.maximum(stats.XtX.diagonal() - stats.n * scaler.mean ** 2, 0)
+        return scaler
+
+    @property
+    def scale(self):
+        "standard deviations, 1 for constant features so they are left as they are"
+        scale = np.sqrt(self.sum_sq / max(self.n, 1))
+        scale[scale == 0] = 1.0
+        return scale
+
+    def to_params(self, theta):
+        "[m', b'] for the standardized features from [m, b]"
+        params = np.empty_like(theta)
+        params[:-1] = theta[:-1] * _rows(self.scale, theta)
+        params[-1] = theta[-1] + self.mean @ theta[:-1]
+        return params
+
+    def to_theta(self, params, out):
+        "[m, b] from [m', b'], written into out (also maps a direction, it is linear)"
+        out[:-1] = params[:-1] / _rows(self.scale, params)
+        out[-1] = params[-1] - self.mean @ out[:-1]
+
+    def scale_slopes(self, slopes):
+        "slopes for [m, b] -> slopes for [m', b'], in place"
+        slopes[:-1] -= np.multiply.outer(self.mean, slopes[-1])
+        slopes[:-1] /= _rows(self.scale, slopes)
+
+
+# set in every worker process by _attach_worker
+_worker = {}
+
+
+def _attach_worker(sources, bounds):
+    "pool initializer : map X and y of the parent without copying them"
+    arrays, handles = [], []
+    for kind, name, shape, dtype, offset in sources:
+        if kind == "shm":
+            shm = shared_memory.SharedMemory(name=name)
+            handles.append(shm)  # keep it open as long as the worker lives
+            arrays.append(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+        else:
+            arrays.append(np.memmap(name, dtype=dtype, mode="r", shape=shape, offset=offset))
+    _worker["X"], _worker["y"] = arrays
+    _worker["handles"] = handles
+    _worker["residual"] = np.empty((np.diff(bounds).max(),) + arrays[1].shape[1:],
+                                   dtype=arrays[0].dtype)
+
+
+def _shard_loss_slopes(args):
+    "loss and slopes of rows start:stop, computed in a worker"
+    start, stop, theta = args
+    slopes = np.empty_like(theta)
+    loss = _loss_slopes(_worker["X"][start:stop], _worker["y"][start:stop], theta,
+                        _worker["residual"][:stop - start], slopes)
+    return loss, slopes
+
+
+class _ParallelSlopes:
+    """
+    Batch GD slopes computed by n_jobs worker processes.
+
+    X and y are shared with the workers, not sent to them :
+    an np.memmap of the right dtype (e.g. np.load(..., mmap_mode="r")) is opened again by
+    every worker, anything else is copied once into multiprocessing.shared_memory.
+    Every worker gets a fixed block of rows (a shard), so per epoch only theta goes to
+    the workers and one (loss, slopes) comes back from each. The partial results
+    are added up in shard order, so the answer is the same on every run.
+
+    Use it as a context manager, leaving it stops the workers and frees the memory.
+
+    """
+
+    def __init__(self, X, y, n_jobs, dtype):
+        self.bounds = np.linspace(0, len(y), min(n_jobs, len(y)) + 1).astype(np.int64)
+        self._shm = []
+        sources = [self._share(X, dtype), self._share(y, dtype)]
+        self._pool = multiprocessing.Pool(len(self.bounds) - 1, initializer=_attach_worker,
+                                          initargs=(sources, self.bounds))
+
+    def _share(self, a, dtype):
+        if (isinstance(a, np.memmap) and isinstance(a.base, mmap.mmap)
+                and a.dtype == dtype and a.flags.c_contiguous):
+            return ("memmap", a.filename, a.shape, dtype.str, a.offset)
+        a = np.ascontiguousarray(a, dtype=dtype)
+        shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        self._shm.append(shm)
+        np.ndarray(a.shape, dtype=dtype, buffer=shm.buf)[...] = a
+        return ("shm", shm.name, a.shape, dtype.str, 0)
+
+    def loss_slopes(self, theta, slopes):
+        shards = [(start, stop, theta) for start, stop in zip(self.bounds[:-1], self.bounds[1:])]
+        loss = 0.0
+        slopes[:] = 0
+        # map keeps the shard order, so the sum is always done in the same order
+        for shard_loss, shard_slopes in self._pool.map(_shard_loss_slopes, shards):
+            loss += shard_loss
+            slopes += shard_slopes
+        return loss
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        for shm in self._shm:
+            shm.close()
+            shm.unlink()
+        self._shm = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+"""
+Update rules (optimizers)
+
+Plain GD moves theta by -learning_rate * slopes. The optimizers below keep some state
+per parameter (one array the size of theta each, allocated once by init) and use it to
+damp the zig-zag we saw with a too high learning rate, or to give every parameter its
+own step size when the features have very different scales.
+All of them update theta and their state in place, the scratch buffer avoids temporaries.
+The names of that state are in _state, it is what a checkpoint keeps of an optimizer
+(its settings, momentum, beta_1, ..., come from the regressor that loads it).
+"""
+
+
+class VanillaGD:
+    "theta = theta - learning_rate * slopes"
+
+    _state = ()
+
+    def init(self, theta):
+        self._tmp = np.empty_like(theta)
+
+    def step(self, theta, slopes, learning_rate):
+        np.multiply(slopes, learning_rate, out=self._tmp)
+        theta -= self._tmp
+
+
+class Momentum(VanillaGD):
+    """
+    velocity = momentum * velocity - learning_rate * slopes
+    theta = theta + velocity
+    """
+
+    _state = ("velocity",)
+
+    def __init__(self, momentum=0.9):
+        self.momentum = momentum
+
+    def init(self, theta):
+        super().init(theta)
+        self.velocity = np.zeros_like(theta)
+
+    def step(self, theta, slopes, learning_rate):
+        np.multiply(slopes, learning_rate, out=self._tmp)
+        self.velocity *= self.momentum
+        self.velocity -= self._tmp
+        theta += self.velocity
+
+
+class Nesterov(Momentum):
+    """
+    Momentum that looks ahead : the slopes are used as if they were taken at
+    theta + momentum * velocity, written so that no second slope evaluation is needed
+
+    theta = theta + momentum * velocity_new - learning_rate * slopes
+    """
+
+    def step(self, theta, slopes, learning_rate):
+        np.multiply(slopes, learning_rate, out=self._tmp)
+        self.velocity *= self.momentum
+        self.velocity -= self._tmp
+        theta -= self._tmp
+        np.multiply(self.velocity, self.momentum, out=self._tmp)
+        theta += self._tmp
+
+
+class AdaGrad(VanillaGD):
+    """
+    every parameter gets its own step : learning_rate / sqrt(sum of its squared slopes so far)
+    """
+
+    _state = ("sum_sq",)
+
+    def __init__(self, epsilon=1e-8):
+        self.epsilon = epsilon
+
+    def init(self, theta):
+        super().init(theta)
+        self.sum_sq = np.zeros_like(theta)
+
+    def _accumulate(self, slopes):
+        np.multiply(slopes, slopes, out=self._tmp)
+        self.sum_sq += self._tmp
+
+    def step(self, theta, slopes, learning_rate):
+        self._accumulate(slopes)
+        np.sqrt(self.sum_sq, out=self._tmp)
+        self._tmp += self.epsilon
+        np.divide(slopes, self._tmp, out=self._tmp)
+        self._tmp *= learning_rate
+        theta -= self._tmp
+
+
+class RMSProp(AdaGrad):
+    """
+    AdaGrad with a moving average of the squared slopes instead of their sum,
+    so the steps do not shrink to zero on long runs
+    """
+
+    def __init__(self, rho=0.9, epsilon=1e-8):
+        self.rho = rho
+        self.epsilon = epsilon
+
+    def _accumulate(self, slopes):
+        np.multiply(slopes, slopes, out=self._tmp)
+        self._tmp *= 1 - self.rho
+        self.sum_sq *= self.rho
+        self.sum_sq += self._tmp
+
+
+class Adam(VanillaGD):
+    """
+    moving averages of the slopes (m) and of the squared slopes (v), bias corrected
+
+    theta = theta - learning_rate * m_hat / (sqrt(v_hat) + epsilon)
+    """
+
+    _state = ("m", "v", "t")
+
+    def __init__(self, beta_1=0.9, beta_2=0.999, epsilon=1e-8):
+        self.beta_1 = beta_1
+        self.beta_2 = beta_2
+        self.epsilon = epsilon
+
+    def init(self, theta):
+        super().init(theta)
+        self.m = np.zeros_like(theta)
+        self.v = np.zeros_like(theta)
+        self.t = 0
+
+    def step(self, theta, slopes, learning_rate):
+        self.t += 1
+        tmp = self._tmp
+        # m = beta_1 * m + (1 - beta_1) * slopes
+        np.multiply(slopes, 1 - self.beta_1, out=tmp)
+        self.m *= self.beta_1
+        self.m += tmp
+        # v = beta_2 * v + (1 - beta_2) * slopes**2
+        np.multiply(slopes, slopes, out=tmp)
+        tmp *= 1 - self.beta_2
+        self.v *= self.beta_2
+        self.v += tmp
+        # sqrt(v_hat) + epsilon, then m_hat / that
+        np.sqrt(self.v, out=tmp)
+        tmp /= np.sqrt(1 - self.beta_2 ** self.t)
+        tmp += self.epsilon
+        np.divide(self.m, tmp, out=tmp)
+        tmp *= learning_rate / (1 - self.beta_1 ** self.t)
+        theta -= tmp
+
+
+_OPTIMIZERS = {"gd": VanillaGD, "momentum": Momentum, "nesterov": Nesterov,
+               "adagrad": AdaGrad, "rmsprop": RMSProp, "adam": Adam}
+
+
+def _make_optimizer(optimizer, theta):
+    "a fresh optimizer with its state allocated for theta, from a name or an instance"
+    if isinstance(optimizer, str):
+        if optimizer not in _OPTIMIZERS:
+            raise ValueError("optimizer must be one of %s or an optimizer instance, got %r"
+                             % (sorted(_OPTIMIZERS), optimizer))
+        optimizer = _OPTIMIZERS[optimizer]()
+    else:
+        # the instance passed in only carries the settings, the state is ours
+        optimizer = copy.copy(optimizer)
+    optimizer.init(theta)
+    return optimizer
+
+
+"""
+Penalties
+
+penalty adds alpha * (l1_ratio * sum(|m|) + (1 - l1_ratio) * sum(m**2)) to the loss,
+b is never penalized. "l2" is l1_ratio=0 (ridge, same alpha as sklearn's Ridge),
+"l1" is l1_ratio=1 (lasso) and "elasticnet" uses l1_ratio as given.
+
+The L2 part is smooth : it just adds 2 * alpha_l2 * m to the slopes.
+The L1 part has no slope at m = 0, so after each step every m is pulled towards 0
+by learning_rate * alpha_l1 and set to exactly 0 if it would cross it
+(soft thresholding, the proximal step of the L1 norm). That is what makes lasso
+weights truly 0 and not just small.
+"""
+
+
+def _soft_threshold(w, threshold):
+    "w = sign(w) * max(|w| - threshold, 0), in place"
+    shrunk = np.abs(w)
+    shrunk -= threshold
+    np.maximum(shrunk, 0, out=shrunk)
+    np.copysign(shrunk, w, out=w)
+
+
+def _sq_subgradient_norm(slopes_m, w, alpha_l1):
+    """
+    squared norm of the smallest slope of loss + alpha_l1 * sum(|w|) for the smooth
+    slopes slopes_m : 0 exactly at the optimum, so tol works with an L1 penalty too
+    """
+    if not alpha_l1:
+        return np.vdot(slopes_m, slopes_m)
+    sub = np.where(w != 0, slopes_m + alpha_l1 * np.sign(w),
+                   np.sign(slopes_m) * np.maximum(np.abs(slopes_m) - alpha_l1, 0))
+    return np.vdot(sub, sub)
+
+
+# sufficient decrease asked for by the Armijo line search, and how much a step is cut per try
+_ARMIJO_C = 1e-4
+_ARMIJO_SHRINK = 0.5
+
+# learning_rate="auto" : up to this many features the Hessian is built and solved exactly,
+# above it L comes from this many power iterations (two passes over X each)
+_EXACT_MAX_FEATURES = 64
+_POWER_ITERATIONS = 10
+
+
+def _nan_if_none(x):
+    "None as NaN, so np.savez stores a plain float and np.load reads it without pickle"
+    return np.nan if x is None else x
+
+
+def _none_if_nan(value):
+    "back from _nan_if_none"
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def _nbytes(X):
+    "bytes of X one pass reads : its values, and for a sparse X its indices too"
+    if _issparse(X):
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    return X.nbytes
+
+
+class _Profiler:
+    """
+    Where the time of the epochs goes, for GDRegressor(profile=True or "memory").
+
+    The NumPy kernel is run one phase at a time with the clock read in between :
+
+    residual   : r = y - X @ m - b, the first read of X
+    slopes     : X.T @ r, the second read of X
+    reductions : sum(r) for the slope of b and r @ r for the loss
+    update     : _update, the penalty, the optimizer step and [m', b'] -> [m, b]
+    other      : the rest of the epoch time : batches, Python, and all the work of the
+                 solvers that do not use the kernel (statistics, line search, n_jobs)
+
+    With memory=True tracemalloc also follows every phase : peak_bytes is the most
+    memory a call had allocated on top of what was in use when it started, and
+    allocating_calls counts the calls that allocated anything at all. tracemalloc
+    slows down every allocation, so take the times from a run without it.
+
+    """
+
+    PHASES = ("residual", "slopes", "reductions", "update")
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.epochs = 0
+        self.seconds = 0.0
+        self.phases = {}
+        for name in self.PHASES:
+            self.phases[name] = {"seconds": 0.0, "calls": 0, "bytes_read": 0}
+            if memory:
+                self.phases[name].update(peak_bytes=0, allocating_calls=0)
+        self._started = False
+        self._mark = 0
+
+    def start(self):
+        "before the epochs, starts tracemalloc for memory=True unless it is running already"
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+
+    def stop(self):
+        "after the epochs, stops tracemalloc if start started it"
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+    def clock(self):
+        "the start of a phase"
+        if self.memory and tracemalloc.is_tracing():
+            self._mark = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        return time.perf_counter()
+
+    def lap(self, name, start, bytes_read=0):
+        "the end of phase `name` that began at start, returns the start of the next phase"
+        seconds = time.perf_counter() - start
+        phase = self.phases[name]
+        phase["seconds"] += seconds
+        phase["calls"] += 1
+        phase["bytes_read"] += bytes_read
+        if self.memory and tracemalloc.is_tracing():
+            allocated = tracemalloc.get_traced_memory()[1] - self._mark
+            phase["peak_bytes"] = max(phase["peak_bytes"], allocated)
+            phase["allocating_calls"] += allocated > 0
+        return self.clock()
+
+    def add_epoch(self, seconds):
+        self.epochs += 1
+        self.seconds += seconds
+
+    def loss_slopes(self, X, y, theta, residual, slopes):
+        "_loss_slopes, timed phase by phase"
+        nbytes = _nbytes(X)
+        start = self.clock()
+        _matvec(X, theta[:-1], residual)
+        np.subtract(y, residual, out=residual)
+        residual -= theta[-1]
+        start = self.lap("residual", start, nbytes)
+        _slopes_m(X, residual, slopes)
+        start = self.lap("slopes", start, nbytes)
+        slopes[-1] = -2 * residual.sum(axis=0, dtype=np.float64)
+        loss = _dot64(residual, residual)
+        self.lap("reductions", start)
+        return loss
+
+    def report(self):
+        """
+        A dict of plain numbers (json.dumps works on it) : epochs, seconds (all the epochs)
+        and per phase seconds, share (of seconds), calls, bytes_read and bytes_per_second
+        (residual and slopes, compare it with the memory bandwidth of the machine),
+        plus peak_bytes and allocating_calls with memory=True.
+        """
+        phases = {name: dict(phase) for name, phase in self.phases.items()}
+        timed = sum(phase["seconds"] for phase in phases.values())
+        phases["other"] = {"seconds": max(self.seconds - timed, 0.0)}
+        for phase in phases.values():
+            phase["share"] = phase["seconds"] / self.seconds if self.seconds else 0.0
+            if phase.get("bytes_read"):
+                phase["bytes_per_second"] = phase["bytes_read"] / max(phase["seconds"], 1e-12)
+        return {"epochs": self.epochs, "seconds": self.seconds, "memory": self.memory,
+                "phases": phases}
+
+
+class GDRegressor:
+    """
+    Vectorized GD for any number of features
+
+    coef_ holds the slopes (one per feature) and intercept_ holds b,
+    same names as sklearn's LinearRegression so they can be compared directly.
+
+    y can also be 2d, (n_samples, n_targets) : every target gets its own m and b
+    (coef_ is then (n_targets, n_features) and intercept_ has one b per target, like
+    LinearRegression), and every epoch updates all of them from one X.T @ R, R being
+    the (n_samples, n_targets) residuals. X is read as often as for one target.
+    The loss, its slopes and the learning rate are those of the sum over the targets.
+
+    solver : "gd" runs GD over the data,
+             "stats" reads the data once into sufficient statistics and runs GD on them,
+             "normal" reads the data once and solves the normal equations exactly
+             (not for an L1 penalty),
+             "cd" reads the data once and runs coordinate descent on the statistics :
+             every epoch sets each m in turn to its best value with the others fixed,
+             the usual solver for lasso and elastic net
+    batch_size : None for batch GD, k for mini-batch GD, 1 for stochastic GD (solver="gd" only)
+    shuffle : deal the rows out to the batches at random every epoch
+    random_state : seed for the shuffling
+    n_jobs : number of worker processes that share the slopes of batch GD
+             (solver="gd", batch_size=None). None or 1 runs in this process.
+    optimizer : update rule, "gd", "momentum", "nesterov", "adagrad", "rmsprop", "adam"
+                or an instance like Adam(beta_1=0.8) for other settings
+
+    schedule : how the learning rate changes with the epoch number e
+               None      : learning_rate all the time
+               "step"        : learning_rate * decay_rate ** floor(e / decay_steps)
+               "exponential" : learning_rate * decay_rate ** (e / decay_steps)
+               "inverse"     : learning_rate / (1 + decay_rate * e / decay_steps)
+    decay_rate, decay_steps : settings of the schedule
+    line_search : "armijo" picks the step of every epoch by backtracking, starting from
+                  twice the last step (learning_rate for the first one) and halving it
+                  until the loss goes down enough. "exact" takes the step that minimizes
+                  the loss along the slopes, the loss being a parabola in the step.
+                  Batch GD with optimizer="gd" only.
+
+    learning_rate="auto" uses 1 / L, L the largest eigenvalue of the Hessian of the loss
+    (2 / L is where GD starts to diverge), estimated before the first epoch, see
+    _auto_learning_rate. Meant for optimizer "gd", "momentum" and "nesterov".
+    learning_rate_ is the learning rate that was used.
+
+    backend : "numba" runs every epoch as one compiled loop over the rows (dense X,
+              solver="gd" without n_jobs or line_search), "numpy" uses NumPy only and
+              "auto" takes numba when it is installed and NumPy otherwise.
+
+    standardize : run GD on the features centered and scaled to unit variance, with
+                  the mean and scale from one extra pass over X (free with solver="stats",
+                  from the first chunk for partial_fit). X is not copied or changed,
+                  coef_ and intercept_ are for the original X. The penalty applies to
+                  the standardized slopes. Not used by solver="normal" and "cd".
+    loss_reduction : "sum" minimizes sum(r**2) like everything above, "mean" minimizes
+                     mean(r**2), so the slopes no longer grow with n_samples. Mini-batches
+                     then use the mean over the batch.
+                     Together with standardize, learning_rate=0.1 suits most data.
+
+    penalty : None, "l2", "l1" or "elasticnet", adds
+              alpha * (l1_ratio * sum(|m|) + (1 - l1_ratio) * sum(m**2)) to the loss
+              (l1_ratio is 0 for "l2" and 1 for "l1"). The L1 part is applied by soft
+              thresholding after each step with the step's learning rate, exact for
+              optimizer="gd". With loss_reduction="sum" mini-batches get
+              alpha * batch_size / n_samples each (partial_fit needs n_samples for that).
+    alpha, l1_ratio : strength and mix of the penalty
+
+    dtype : float32 or float64 for the data, m, b and every buffer. None keeps float32
+            data in float32 (nothing is upcast) and uses float64 for anything else.
+            The big sums (X.T @ r, the loss, the statistics) are always added up in float64.
+
+    record_every : keep one row of history_ every record_every epochs, None keeps none.
+                   history_ is a structured array allocated once before the first epoch,
+                   with the fields epoch, loss, slope_norm, seconds (wall time of that epoch)
+                   and params (m's and b, b last), e.g. gd.history_["loss"].
+    record_params : keep params in history_. None keeps them for a single target only :
+                    for a 2d y every row would hold all of m and b, n_features + 1 values
+                    per target, so it is left out unless record_params=True.
+    callback : called as callback(regressor, epoch, loss, slope_norm) after every epoch,
+               returning True stops the run
+
+    warm_start : fit and fit_stream carry on from the m, b, optimizer state and epoch
+                 count of the last fit (or of load) instead of starting over, so
+                 10 epochs then 40 more is the same as 50 epochs from the start.
+                 fit(X, y, coef_init=..., intercept_init=...) picks the starting point
+                 instead of m = 100, b = -120.
+    save / load write and read m, b and the optimizer state to an .npz checkpoint.
+
+    tol : stop early once the loss improves by less than tol * loss for
+          n_iter_no_change epochs in a row (for batch GD also once the slopes
+          have shrunk below tol times the slopes of the first epoch).
+          None always runs all the epochs.
+    n_iter_no_change : number of epochs used by the tol check and the divergence check
+
+    Whatever tol is, a run is stopped with a warning as soon as m, b or the loss
+    stop being finite numbers, or when the slopes have grown n_iter_no_change epochs
+    in a row and are bigger than they were in the first epoch (learning rate too high).
+    n_iter_, converged_ and diverged_ tell what happened.
+
+    profile : True times every epoch phase by phase (the residual, X.T @ r, the two
+              reductions, the update and the rest), "memory" also follows the allocations
+              of every phase with tracemalloc. profile_ is then the report of the last fit,
+              see _Profiler. Profiling runs the NumPy kernel whatever backend is.
+              False (the default) adds one check per update and per epoch, nothing more.
+
+    fit needs X and y in memory, fit_stream reads them chunk by chunk
+    and partial_fit learns from one chunk at a time.
+    predict and score also go through X chunk by chunk, so X can be a memmap.
+
+    """
+
+    def __init__(self, learning_rate, epochs, batch_size=None, shuffle=True,
+                 random_state=None, tol=None, n_iter_no_change=5, solver="gd",
+                 n_jobs=None, optimizer="gd", schedule=None, decay_rate=0.5,
+                 decay_steps=10, line_search=None, record_every=1, callback=None,
+                 dtype=None, warm_start=False, backend="auto", penalty=None, alpha=1.0,
+                 l1_ratio=0.5, standardize=False, loss_reduction="sum", profile=False,
+                 record_params=None):
+        self.learning_rate = learning_rate
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.random_state = random_state
+        self.tol = tol
+        self.n_iter_no_change = n_iter_no_change
+        self.solver = solver
+        self.n_jobs = n_jobs
+        self.optimizer = optimizer
+        self.schedule = schedule
+        self.decay_rate = decay_rate
+        self.decay_steps = decay_steps
+        self.line_search = line_search
+        self.record_every = record_every
+        self.record_params = record_params
+        self.callback = callback
+        self.dtype = dtype
+        self.warm_start = warm_start
+        self.backend = backend
+        self.penalty = penalty
+        self.alpha = alpha
+        self.l1_ratio = l1_ratio
+        self.standardize = standardize
+        self.loss_reduction = loss_reduction
+        self.profile = profile
+
+    def _warm(self):
+        "True when the next fit carries on from the current m and b"
+        return self.warm_start and getattr(self, "_theta", None) is not None
+
+    def _check_params(self):
+        "validate the settings and derive what the epochs need from them"
+        if self.solver not in ("gd", "stats", "normal", "cd"):
+            raise ValueError("solver must be 'gd', 'stats', 'normal' or 'cd', got %r"
+                             % (self.solver,))
+        if self.batch_size is not None and self.batch_size < 1:
+            raise ValueError("batch_size must be None or >= 1, got %r" % (self.batch_size,))
+        if self.batch_size is not None and self.solver != "gd":
+            raise ValueError("batch_size only applies to solver='gd'")
+        if self.schedule not in (None, "step", "exponential", "inverse"):
+            raise ValueError("schedule must be None, 'step', 'exponential' or 'inverse', got %r"
+                             % (self.schedule,))
+        if self.line_search not in (None, "armijo", "exact"):
+            raise ValueError("line_search must be None, 'armijo' or 'exact', got %r"
+                             % (self.line_search,))
+        if isinstance(self.learning_rate, str) and self.learning_rate != "auto":
+            raise ValueError("learning_rate must be a number or 'auto', got %r"
+                             % (self.learning_rate,))
+        if self.line_search is not None and (self.optimizer != "gd" or self.schedule is not None
+                                             or self.batch_size is not None
+                                             or (self.n_jobs or 1) > 1):
+            raise ValueError("line_search needs batch GD (batch_size=None, n_jobs=None) "
+                             "with optimizer='gd' and no schedule")
+        ratios = {None: 0.0, "l2": 0.0, "l1": 1.0, "elasticnet": self.l1_ratio}
+        if self.penalty not in ratios:
+            raise ValueError("penalty must be None, 'l2', 'l1' or 'elasticnet', got %r"
+                             % (self.penalty,))
+        if self.alpha < 0 or not 0 <= self.l1_ratio <= 1:
+            raise ValueError("alpha must be >= 0 and l1_ratio between 0 and 1")
+        alpha = 0.0 if self.penalty is None else self.alpha
+        self._alpha_l1 = alpha * ratios[self.penalty]
+        self._alpha_l2 = alpha - self._alpha_l1
+        if self._alpha_l1 and self.line_search:
+            raise ValueError("line_search does not support an L1 penalty")
+        if self._alpha_l1 and self.solver == "normal":
+            raise ValueError("an L1 penalty has no exact solution, use solver='cd'")
+        if self.loss_reduction not in ("sum", "mean"):
+            raise ValueError("loss_reduction must be 'sum' or 'mean', got %r"
+                             % (self.loss_reduction,))
+        self._loss_slopes = _loss_slopes_function(self.backend)
+        if self.profile not in (False, True, "memory"):
+            raise ValueError("profile must be False, True or 'memory', got %r" % (self.profile,))
+        self._profiler = None
+        if self.profile:
+            self._profiler = _Profiler(memory=self.profile == "memory")
+            self._loss_slopes = self._profiler.loss_slopes
+
+    def _check_shape(self, n_features, target_shape, done):
+        "X and y must have the features and targets the model was `done` with"
+        if len(self._theta) != n_features + 1:
+            raise ValueError("X has %d features, the model was %s %d"
+                             % (n_features, done, len(self._theta) - 1))
+        if self._theta.shape[1:] != target_shape:
+            raise ValueError("y has %d targets, the model was %s %d"
+                             % ((target_shape or (1,))[0], done, (self._theta.shape[1:] or (1,))[0]))
+
+    def _init_params(self, n_features, dtype, coef_init=None, intercept_init=None,
+                     target_shape=()):
+        self._check_params()
+        if self._warm() and coef_init is None and intercept_init is None:
+            self._check_shape(n_features, target_shape, "fitted with")
+            self._apply_learning_rate()
+            return
+        # same starting point as above : every slope at 100 and b at -120
+        # (one column per target, coef_init is laid out like coef_)
+        self._theta = np.full((n_features + 1,) + target_shape, 100.0, dtype=dtype)
+        self._theta[-1] = -120.0
+        if coef_init is not None:
+            self._theta[:-1] = np.transpose(coef_init)
+        if intercept_init is not None:
+            self._theta[-1] = intercept_init
+        self._rng = np.random.default_rng(self.random_state)
+        # _params is what the optimizer moves : theta itself, or [m', b'] once standardized
+        self._scaler = None
+        self._params = self._theta
+        self._optimizer = _make_optimizer(self.optimizer, self._params)
+        self._epochs_done = 0
+        self._base_lr = self._auto_lr = self._step_size = None
+        self._apply_learning_rate()
+
+    def _apply_learning_rate(self):
+        """
+        The learning rate of this fit, read from the learning_rate setting on every fit,
+        so a warm start uses the setting as it is now. "auto" keeps the estimate it
+        already has (None until _resolve_learning_rate makes one).
+        """
+        base_lr = self._auto_lr if self.learning_rate == "auto" else self.learning_rate
+        if base_lr is not None and base_lr != self._base_lr:
+            self._step_size = base_lr / 2  # so the first line search starts at learning_rate
+        self._base_lr = base_lr
+
+    def _auto_learning_rate(self, n_features, chunks=None, stats=None, batch_size=None):
+        """
+        learning_rate="auto" : 1 / L with L the largest eigenvalue of the Hessian of what
+        is minimized, in the units the optimizer moves (standardized or not).
+        For the squared loss the Hessian is the same for every m and b (and for every
+        target, so L does not depend on y at all) :
+
+        H = 2 * [[X.T @ X, X.T @ 1],
+                 [1 @ X,   n      ]]
+
+        With stats, or with up to _EXACT_MAX_FEATURES features (then X.T @ X is made in
+        one pass over chunks()), all the eigenvalues of H are computed exactly; for a single
+        feature H is the 2x2 matrix of sum(X*X), sum(X) and n. With more features a few
+        power iterations estimate L from products with X only. They approach L from below,
+        and 1 / L stays stable as long as the estimate is more than L / 2.
+        chunks() returns a new iterator of (X_chunk, y_chunk) every time it is called,
+        batch_size is the size of the batches the steps will take (None for full batches).
+
+        For full batches H is scaled the way _penalize scales the loss of a step (divided
+        by n for loss_reduction="mean") before the L2 penalty, 2 * alpha_l2 for every m,
+        is added with the weight _penalize gives it.
+
+        A mini-batch is not an average batch : its H is the sum of 2 * z @ z.T over its
+        rows z = [x, 1] only, and can be far steeper than batch_size / n of the full one
+        (a single row has 2 * |z|**2). So for batch_size < n, L is bounded by the largest
+        row, 2 * batch_size * max(|z|**2) (never more than the full H; for
+        loss_reduction="mean" 2 * max(|z|**2) or the full H over the smallest batch),
+        plus the batch's penalty. max(|z|**2)
+        comes from the same pass that makes X.T @ X or the first power iteration.
+
+        """
+        row_sq_max = 0.0
+        if stats is None and n_features <= _EXACT_MAX_FEATURES:
+            stats = _SufficientStats(n_features, self._theta.shape[1:])
+            for X_chunk, y_chunk in chunks():
+                X_chunk, y_chunk = _check_X_y(X_chunk, y_chunk, self._theta.dtype)
+                stats.update(X_chunk, y_chunk)
+                row_sq_max = max(row_sq_max, self._row_sq_max(X_chunk))
+        if stats is not None:
+            n_samples = stats.n
+            hessian = np.empty((n_features + 1, n_features + 1))
+            hessian[:-1, :-1] = stats.XtX
+            hessian[:-1, -1] = hessian[-1, :-1] = stats.sum_X
+            hessian[-1, -1] = stats.n
+            hessian *= 2
+            if self._scaler is not None:
+                # theta = J @ params, so the Hessian for params is J.T @ H @ J
+                J = np.empty_like(hessian)
+                for j, column in enumerate(np.eye(n_features + 1)):
+                    self._scaler.to_theta(column, J[:, j])
+                hessian = J.T @ hessian @ J
+            if batch_size is not None and batch_size < n_samples:
+                return self._mini_batch_learning_rate(
+                    batch_size, n_samples, row_sq_max, np.linalg.eigvalsh(hessian)[-1])
+            scale, weight = self._hessian_scales(n_samples)
+            hessian *= scale
+            hessian[np.arange(n_features), np.arange(n_features)] += 2 * weight * self._alpha_l2
+            L = np.linalg.eigvalsh(hessian)[-1]
+        else:
+            v = np.random.default_rng(0).standard_normal(n_features + 1)
+            v /= np.linalg.norm(v)
+            direction, hv = np.empty_like(v), np.empty_like(v)
+            for i in range(_POWER_ITERATIONS):
+                hv[:] = 0
+                n_samples = 0
+                self._direction(v, direction)
+                for X_chunk, y_chunk in chunks():
+                    X_chunk = _check_X_y(X_chunk, y_chunk, np.float64)[0]
+                    if i == 0:
+                        row_sq_max = max(row_sq_max, self._row_sq_max(X_chunk))
+                    u = np.empty(X_chunk.shape[0])
+                    _matvec(X_chunk, direction[:-1], u)
+                    u += direction[-1]
+                    hv[:-1] += X_chunk.T @ u
+                    hv[-1] += u.sum()
+                    n_samples += X_chunk.shape[0]
+                if self._scaler is not None:
+                    self._scaler.scale_slopes(hv)
+                if batch_size is not None and batch_size < n_samples:
+                    scale, weight = 1.0, 0.0  # the data part alone, see below
+                else:
+                    scale, weight = self._hessian_scales(n_samples)
+                hv *= 2 * scale
+                hv[:-1] += 2 * weight * self._alpha_l2 * v[:-1]
+                L = v @ hv  # Rayleigh quotient
+                v[:] = hv / np.linalg.norm(hv)
+            if batch_size is not None and batch_size < n_samples:
+                return self._mini_batch_learning_rate(batch_size, n_samples, row_sq_max, L)
+        if L <= 0:
+            return 1.0  # constant X and y, any step is fine
+        return 1.0 / L
+
+    def _hessian_scales(self, n_samples):
+        "factors for the full batch Hessian of the squared errors and the penalty, as _penalize"
+        if self.loss_reduction == "mean":
+            return 1.0 / n_samples, 1.0
+        return 1.0, 1.0
+
+    def _mini_batch_learning_rate(self, batch, n_samples, row_sq_max, L_full):
+        "1 / L for the steepest batch of batch rows, L_full the largest eigenvalue of the full H"
+        if self.loss_reduction == "mean":
+            # the mean over the last batch, the smallest one, is the steepest
+            L = min(2 * row_sq_max, L_full / (n_samples % batch or batch))
+            weight = 1.0
+        else:
+            L = min(2 * batch * row_sq_max, L_full)
+            weight = batch / n_samples
+        L += 2 * weight * self._alpha_l2
+        if L <= 0:
+            return 1.0
+        return 1.0 / L
+
+    def _row_sq_max(self, X):
+        "largest |[x, 1]|**2 of the rows of X, in the units the optimizer moves"
+        if self._scaler is None:
+            w, mean = np.ones(X.shape[1]), np.zeros(X.shape[1])
+        else:
+            w, mean = self._scaler.scale ** -2, self._scaler.mean
+        if X.shape[0] == 0:
+            return 0.0
+        # |(x - mean) / scale|**2 expanded, so a sparse X stays sparse
+        if _issparse(X):
+            sq = np.asarray(X.multiply(X) @ w).ravel()
+        else:
+            sq = np.einsum("ij,ij,j->i", X, X, w, dtype=np.float64)
+        sq -= 2 * np.asarray(X @ (mean * w)).ravel()
+        return float(sq.max()) + mean @ (mean * w) + 1.0
+
+    def _resolve_learning_rate(self, n_features, chunks=None, stats=None, batch_size=None):
+        "for learning_rate='auto', estimate it before the first epoch"
+        if self._base_lr is None:
+            self._auto_lr = self._auto_learning_rate(n_features, chunks, stats, batch_size)
+            self._apply_learning_rate()
+
+    def _current_learning_rate(self):
+        "learning rate of the epoch that is about to run"
+        lr = self._base_lr
+        e = self._epochs_done / self.decay_steps
+        if self.schedule is None or lr is None:
+            return lr
+        if self.schedule == "step":
+            return lr * self.decay_rate ** np.floor(e)
+        if self.schedule == "exponential":
+            return lr * self.decay_rate ** e
+        return lr / (1 + self.decay_rate * e)
+
+    def _line_search_step(self, loss, slopes, curvature, n_rows):
+        """
+        Move theta along -slopes with a line search, returns the step t.
+
+        For the squared loss, with u = X @ slopes_m + slopes_b and r the residual,
+        loss(theta - t * slopes) = sum((r + t * u)**2) = loss - t * |slopes|**2 + t**2 * |u|**2
+        so once curvature = |u|**2 is known every step we try costs O(1), not a pass over X.
+        "armijo" backtracks on that parabola, "exact" takes its lowest point,
+        t = |slopes|**2 / (2 * curvature).
+        loss and slopes must already be those of _penalize, and u is then computed from
+        _direction(slopes) : the same move, in the units of m and b.
+
+        """
+        sq_slopes = np.vdot(slopes, slopes)
+        if sq_slopes == 0:
+            return 0.0
+        if self.loss_reduction == "mean":
+            curvature /= n_rows
+        # the L2 penalty adds alpha_l2 * |slopes_m|**2 to the t**2 term
+        curvature += self._alpha_l2 * np.vdot(slopes[:-1], slopes[:-1])
+        if self.line_search == "exact" and curvature > 0:
+            t = sq_slopes / (2 * curvature)
+        else:
+            t = 2 * self._step_size
+            while loss - t * sq_slopes + t * t * curvature > loss - _ARMIJO_C * t * sq_slopes:
+                t *= _ARMIJO_SHRINK
+        self._step_size = t
+        self._params -= t * slopes
+        self._sync()
+        return t
+
+    def _set_attributes(self):
+        # (n_targets, n_features) and one intercept per target for a 2d y, as in sklearn
+        self.coef_ = self._theta[:-1].T
+        self.intercept_ = float(self._theta[-1]) if self._theta.ndim == 1 else self._theta[-1].copy()
+        self.learning_rate_ = self._base_lr
+        self.profile_ = None if self._profiler is None else self._profiler.report()
+
+    def _sync(self):
+        "theta (m and b, what the epochs use) from _params after a step"
+        if self._scaler is not None:
+            self._scaler.to_theta(self._params, self._theta)
+
+    def _set_scaler(self, scaler):
+        "from now on the optimizer moves the standardized [m', b']"
+        self._scaler = scaler
+        self._params = scaler.to_params(self._theta)
+        self._optimizer = _make_optimizer(self.optimizer, self._params)
+
+    def _direction(self, slopes, out):
+        "the move of m and b for a move of _params along slopes"
+        if self._scaler is None:
+            out[:] = slopes
+        else:
+            self._scaler.to_theta(slopes, out)
+        return out
+
+    def _penalize(self, loss, slopes, n_rows, n_total):
+        """
+        Turn the loss and slopes of the squared errors of n_rows rows (out of n_total)
+        into those of what is minimized, in place : averaged for loss_reduction="mean",
+        taken over to the standardized [m', b'], and penalty added (its L2 part to the slopes).
+        Returns that loss and the squared norm of its slopes.
+
+        """
+        if self.loss_reduction == "mean":
+            loss /= n_rows
+            slopes /= n_rows
+            weight = 1.0
+        else:
+            weight = n_rows / n_total
+        if self._scaler is not None:
+            self._scaler.scale_slopes(slopes)
+        if not (self._alpha_l1 or self._alpha_l2):
+            return loss, np.vdot(slopes, slopes)
+        m = self._params[:-1]
+        alpha_l1, alpha_l2 = weight * self._alpha_l1, weight * self._alpha_l2
+        loss += alpha_l1 * float(np.abs(m).sum(dtype=np.float64)) + alpha_l2 * _dot64(m, m)
+        if alpha_l2:
+            slopes[:-1] += (2 * alpha_l2) * m
+        return loss, _sq_subgradient_norm(slopes[:-1], m, alpha_l1) + np.vdot(slopes[-1], slopes[-1])
+
+    def _update(self, loss, slopes, n_rows, n_total):
+        """
+        one step of the optimizer from the slopes of the squared errors of n_rows rows,
+        returns the loss and the squared norm of the slopes of _penalize, before the step
+        """
+        profiler = self._profiler
+        if profiler is not None:
+            start = profiler.clock()
+        loss, sq_slopes = self._penalize(loss, slopes, n_rows, n_total)
+        self._optimizer.step(self._params, slopes, self._lr)
+        if self._alpha_l1:
+            weight = 1.0 if self.loss_reduction == "mean" else n_rows / n_total
+            _soft_threshold(self._params[:-1], weight * self._alpha_l1 * self._lr)
+        self._sync()
+        if profiler is not None:
+            profiler.lap("update", start)
+        return loss, sq_slopes
+
+    def _epoch(self, X, y, residual, slopes, n_total=None):
+        """
+        one pass over X, one update of m and b per batch
+        returns the loss of the epoch and the norm of its slopes
+        (summed over the batches, measured before each update)
+        n_total is the number of rows the penalty is shared out over, len(y) if None
+        The epoch stops at the first batch whose loss or slopes are not finite,
+        the rest of it would only update inf and NaN; _run then sees the run diverged.
+
+        """
+        n_total = len(y) if n_total is None else n_total
+        theta = self._theta
+        loss = sum_sq_slopes = 0.0
+        for batch in _batches(len(y), self.batch_size, self.shuffle, self._rng):
+            X_batch, y_batch = X[batch], y[batch]
+            batch_loss = self._loss_slopes(X_batch, y_batch, theta, residual[:len(y_batch)],
+                                           slopes)
+            # update m and b together
+            batch_loss, sq_slopes = self._update(batch_loss, slopes, len(y_batch), n_total)
+            if self.loss_reduction == "mean":
+                batch_loss *= len(y_batch) / len(y)  # so the epoch's loss is the mean over X
+            loss += batch_loss
+            sum_sq_slopes += sq_slopes
+            if not (np.isfinite(batch_loss) and np.isfinite(sq_slopes)):
+                break
+        return loss, np.sqrt(sum_sq_slopes)
+
+    def _run(self, epoch, full_batch):
+        """
+        Call epoch() up to self.epochs times and stop early when it has converged
+        or is diverging. Only looks at the loss and slope norm that epoch() returns,
+        so the checks cost nothing compared to the epoch itself.
+
+        """
+        self.converged_ = self.diverged_ = False
+        best_loss = last_norm = np.inf
+        first_norm = None
+        no_improvement = growing = 0
+
+        stride = self.record_every
+        history = None
+        record_params = self.record_params
+        if record_params is None:
+            record_params = self._theta.ndim == 1
+        if stride:
+            fields = [("epoch", np.int64), ("loss", np.float64), ("slope_norm", np.float64),
+                      ("seconds", np.float64)]
+            if record_params:
+                fields.append(("params", np.float64, self._theta.shape))
+            history = np.zeros(-(-self.epochs // stride), dtype=fields)
+        n_records = 0
+        profiler = self._profiler
+        if profiler is not None:
+            profiler.start()
+
+        for i in range(self.epochs):
+            self._lr = self._current_learning_rate()
+            start = time.perf_counter()
+            loss, slope_norm = epoch()
+            seconds = time.perf_counter() - start
+            self._epochs_done += 1
+            self.n_iter_ = i + 1
+            if profiler is not None:
+                profiler.add_epoch(seconds)
+
+            # epochs are counted from the very first fit, warm starts included
+            if history is not None and i % stride == 0:
+                row = history[n_records]
+                row["epoch"], row["loss"] = self._epochs_done, loss
+                row["slope_norm"], row["seconds"] = slope_norm, seconds
+                if record_params:
+                    row["params"] = self._theta
+                n_records += 1
+            if self.callback is not None and self.callback(self, self._epochs_done, loss,
+                                                           slope_norm):
+                break
+
+            if not (np.isfinite(loss) and np.isfinite(slope_norm)
+                    and np.isfinite(self._theta).all()):
+                self._diverged("m, b or the loss are no longer finite numbers")
+                break
+            if first_norm is None:
+                first_norm = slope_norm
+            growing = growing + 1 if slope_norm > last_norm else 0
+            last_norm = slope_norm
+            if growing >= self.n_iter_no_change and slope_norm > first_norm:
+                self._diverged("the slopes grew for %d epochs in a row" % growing)
+                break
+
+            if self.tol is None:
+                continue
+            if full_batch and slope_norm <= self.tol * first_norm:
+                self.converged_ = True
+                break
+            no_improvement = no_improvement + 1 if loss > best_loss - self.tol * best_loss else 0
+            best_loss = min(best_loss, loss)
+            if no_improvement >= self.n_iter_no_change:
+                self.converged_ = True
+                break
+
+        self.history_ = None if history is None else history[:n_records]
+        if profiler is not None:
+            profiler.stop()
+
+    def _diverged(self, reason):
+        self.diverged_ = True
+        warnings.warn("GD diverged after %d epochs : %s, try a smaller learning_rate"
+                      % (self.n_iter_, reason), RuntimeWarning)
+
+    def _fit_stats(self, stats):
+        "solver='stats', 'normal' and 'cd', starting from the current theta"
+        # for loss_reduction="mean" the penalty is n times heavier next to sum(r**2)
+        n_alpha = stats.n if self.loss_reduction == "mean" else 1
+        if self.solver == "normal":
+            self._theta[:] = stats.solve(n_alpha * self._alpha_l2)
+            self.n_iter_ = 0
+            self.history_ = None
+            self.converged_, self.diverged_ = True, False
+        elif self.solver == "cd":
+            self._run(self._cd_epochs(stats, n_alpha), full_batch=True)
+        else:
+            if self.standardize and self._scaler is None:
+                self._set_scaler(_Scaler.from_stats(stats))
+            self._resolve_learning_rate(len(stats.sum_X), stats=stats)
+            slopes = np.empty_like(self._theta)
+            direction = np.empty(slopes.shape)
+
+            def epoch():
+                loss = stats.loss_slopes(self._theta, slopes)
+                if self.line_search:
+                    loss, sq_slopes = self._penalize(loss, slopes, stats.n, stats.n)
+                    curvature = stats.curvature(self._direction(slopes, direction))
+                    self._line_search_step(loss, slopes, curvature, stats.n)
+                else:
+                    loss, sq_slopes = self._update(loss, slopes, stats.n, stats.n)
+                return loss, np.sqrt(sq_slopes)
+
+            self._run(epoch, full_batch=True)
+        self.stats_ = stats
+        self._set_attributes()
+        return self
+
+    def _cd_epochs(self, stats, n_alpha):
+        """
+        epoch function for solver="cd" : one sweep of coordinate descent over the m's.
+
+        On the centered statistics Q = Xc.T @ Xc, c = Xc.T @ yc (b is then exact, mean_y - mean_X @ m)
+        the best m_j with every other m fixed is
+
+        m_j = soft_threshold(rho_j, alpha_l1 / 2) / (Q_jj + alpha_l2)
+        rho_j = c_j - (Q @ m)_j + Q_jj * m_j
+
+        Q @ m is kept up to date by adding (change of m_j) * Q[j] (Q is symmetric),
+        so a sweep costs O(n_features**2) whatever the number of rows.
+        With several targets m_j, rho_j and c_j are rows, one number per target.
+        The alphas are multiplied by n_alpha (n for loss_reduction="mean").
+
+        """
+        mean_X, mean_y, Q, c, var_y = stats.centered()
+        alpha_l1, alpha_l2 = n_alpha * self._alpha_l1, n_alpha * self._alpha_l2
+        diag = Q.diagonal() + alpha_l2
+        half_l1 = alpha_l1 / 2
+        m = self._theta[:-1].astype(np.float64)
+        Qm = Q @ m
+
+        def epoch():
+            for j in range(len(m)):
+                if diag[j] == 0:
+                    continue  # a constant feature, m_j does not change the loss
+                rho = c[j] - Qm[j] + Q[j, j] * m[j]
+                new = np.sign(rho) * np.maximum(np.abs(rho) - half_l1, 0.0) / diag[j]
+                if np.any(new != m[j]):
+                    np.add(Qm, np.multiply.outer(Q[j], new - m[j]), out=Qm)
+                    m[j] = new
+            self._theta[:-1] = m
+            self._theta[-1] = mean_y - mean_X @ m
+            loss = (np.sum(var_y) - 2 * np.vdot(c, m) + np.vdot(m, Qm)
+                    + alpha_l1 * np.abs(m).sum() + alpha_l2 * np.vdot(m, m)) / n_alpha
+            # the slope of b is 0, b is set to its best value every sweep
+            slopes_m = 2 * (Qm - c) + 2 * alpha_l2 * m
+            return loss, np.sqrt(_sq_subgradient_norm(slopes_m, m, alpha_l1)) / n_alpha
+
+        return epoch
+
+    def fit(self, X, y, coef_init=None, intercept_init=None):
+        "calculate m and b using GD, from coef_init and intercept_init when they are given"
+        X_in, y_in = X, y
+        X, y = _check_X_y(X, y, self._theta.dtype if self._warm() else self.dtype)
+        n_samples, n_features = X.shape
+        self._init_params(n_features, X.dtype, coef_init, intercept_init, y.shape[1:])
+        if self.solver != "gd":
+            return self._fit_stats(_SufficientStats(n_features, y.shape[1:]).update(X, y))
+        if self.standardize and self._scaler is None:
+            self._set_scaler(_Scaler(n_features).update(X))
+        self._resolve_learning_rate(n_features, lambda: _iter_chunks(X, y, _PREDICT_ROWS),
+                                    batch_size=self.batch_size)
+
+        slopes = np.empty_like(self._theta)
+        full_batch = self.batch_size is None or self.batch_size >= n_samples
+
+        if self.n_jobs is not None and self.n_jobs > 1:
+            if not full_batch:
+                raise ValueError("n_jobs only applies to batch GD (batch_size=None)")
+            if _issparse(X):
+                raise ValueError("n_jobs does not support sparse X")
+            # X_in and y_in so a memmap is passed on as a memmap
+            X_in = X_in if np.ndim(X_in) == 2 else X
+            y_in = y_in if np.shape(y_in) == y.shape else y
+            with _ParallelSlopes(X_in, y_in, self.n_jobs, X.dtype) as parallel:
+
+                def epoch():
+                    loss, sq_slopes = self._update(parallel.loss_slopes(self._theta, slopes),
+                                                   slopes, n_samples, n_samples)
+                    return loss, np.sqrt(sq_slopes)
+
+                self._run(epoch, full_batch=True)
+        elif self.line_search:
+            self._run(self._line_search_epochs(X, y, slopes), full_batch=True)
+        else:
+            # big enough for the largest batch, each batch uses residual[:len(batch)]
+            residual = np.empty((min(self.batch_size or n_samples, n_samples),) + y.shape[1:],
+                                dtype=X.dtype)
+            self._run(lambda: self._epoch(X, y, residual, slopes), full_batch)
+
+        self._set_attributes()
+        return self
+
+    def _line_search_epochs(self, X, y, slopes):
+        """
+        epoch function for batch GD with a line search.
+
+        Plain GD reads X twice per epoch : X @ m for the residual and X.T @ r for the slopes.
+        Here the second read of the epoch is u = X @ slopes_m + slopes_b instead, which gives
+        the curvature for the line search AND the new residual, r_new = r + t * u,
+        so the next epoch can start straight from X.T @ r. Still two reads of X per epoch.
+
+        """
+        residual = np.empty_like(y)
+        u = np.empty_like(y)
+        direction = np.empty_like(slopes)
+        fresh = True
+
+        def epoch():
+            nonlocal fresh
+            if fresh:
+                loss = _loss_slopes(X, y, self._theta, residual, slopes)
+                fresh = False
+            else:
+                loss = _residual_loss_slopes(X, residual, slopes)
+            loss, sq_slopes = self._penalize(loss, slopes, len(y), len(y))
+            self._direction(slopes, direction)
+            _matvec(X, direction[:-1], u)
+            np.add(u, direction[-1], out=u)
+            t = self._line_search_step(loss, slopes, _dot64(u, u), len(y))
+            np.multiply(u, t, out=u)
+            np.add(residual, u, out=residual)
+            return loss, np.sqrt(sq_slopes)
+
+        return epoch
+
+    def partial_fit(self, X, y, n_samples=None):
+        """
+        One epoch over this chunk only, starting from where the last call stopped.
+        Call it once per chunk when the data arrives in pieces.
+
+        With solver="stats", "normal" or "cd" the chunk is added to the statistics
+        of all the chunks seen so far (stats_) and m and b are fitted to those,
+        so after the last chunk the answer is the same as fit on all the data.
+
+        n_samples : the number of rows of all the chunks together. With solver="gd",
+                    a penalty and loss_reduction="sum" every chunk is a mini-batch and
+                    gets alpha * len(chunk) / n_samples, so it is required then.
+
+        """
+        if (self.solver == "gd" and self.penalty is not None and self.loss_reduction == "sum"
+                and n_samples is None):
+            raise ValueError("partial_fit with a penalty needs n_samples, the number of rows "
+                             "of all the chunks, to share alpha out over them")
+        started = getattr(self, "_theta", None) is not None
+        X, y = _check_X_y(X, y, self._theta.dtype if started else self.dtype)
+        if not started:
+            self._init_params(X.shape[1], X.dtype, target_shape=y.shape[1:])
+            self.stats_ = _SufficientStats(X.shape[1], y.shape[1:])
+        else:
+            self._check_shape(X.shape[1], y.shape[1:], "started with")
+            self._apply_learning_rate()
+        if self.solver != "gd":
+            return self._fit_stats(self.stats_.update(X, y))
+        if n_samples is not None and n_samples < len(y):
+            raise ValueError("n_samples is %d but the chunk has %d rows" % (n_samples, len(y)))
+        if self.standardize and self._scaler is None:
+            self._set_scaler(_Scaler(X.shape[1]).update(X))
+        # learning_rate="auto" is estimated from the first chunk
+        self._resolve_learning_rate(X.shape[1], lambda: _iter_chunks(X, y, _PREDICT_ROWS),
+                                    batch_size=self.batch_size)
+        residual = np.empty((min(self.batch_size or len(y), len(y)),) + y.shape[1:], dtype=X.dtype)
+        self._lr = self._current_learning_rate()
+        profiler = self._profiler
+        if profiler is not None:
+            profiler.start()
+        start = time.perf_counter()
+        self._epoch(X, y, residual, np.empty_like(self._theta), n_samples)
+        if profiler is not None:
+            profiler.add_epoch(time.perf_counter() - start)
+            profiler.stop()
+        self._epochs_done += 1
+        self._set_attributes()
+        return self
+
+    def fit_stream(self, X, y=None, chunk_size=100_000, coef_init=None, intercept_init=None):
+        """
+        Batch GD over data that does not fit in memory.
+
+        X and y can be arrays, np.memmap's or paths to .npy files (opened with
+        mmap_mode="r"), which are read chunk_size rows at a time.
+        X can also be a function that returns a new iterator of (X_chunk, y_chunk)
+        every time it is called, one call per epoch.
+
+        The slopes of every chunk are added up and m and b are updated once per
+        epoch, so the result is the same as fit(X, y) with batch_size=None,
+        but only one chunk is in memory at any time.
+        With solver="stats", "normal" or "cd" the chunks are read only once.
+
+        """
+        if self.line_search and self.solver == "gd":
+            raise ValueError("line_search needs X in memory, use fit or solver='stats'")
+        if callable(X):
+            chunks = X
+        else:
+            if y is None:
+                raise ValueError("y is required unless X is a function returning chunks")
+            X, y = _open_array(X), _open_array(y)
+            if X.shape[0] != len(y):
+                raise ValueError("X has %d rows but y has %d" % (X.shape[0], len(y)))
+            chunks = lambda: _iter_chunks(X, y, chunk_size)
+
+        # the number of features and targets from the first chunk (views, nothing is read yet)
+        first = next(iter(chunks()), None)
+        if first is None:
+            raise ValueError("no data : the chunk iterator was empty")
+        shape = np.shape(first[0])
+        n_features = shape[1] if len(shape) == 2 else 1
+        target_shape = _target_shape(np.shape(first[1]))
+        dtype = self._theta.dtype if self._warm() else _float_dtype(first[0], self.dtype)
+        self._init_params(n_features, dtype, coef_init, intercept_init, target_shape)
+
+        if self.solver != "gd":
+            stats = _SufficientStats(n_features, target_shape)
+            for X_chunk, y_chunk in chunks():
+                stats.update(*_check_X_y(X_chunk, y_chunk, dtype))
+            return self._fit_stats(stats)
+
+        if self.standardize and self._scaler is None:
+            scaler = _Scaler(n_features)
+            for X_chunk, _ in chunks():
+                scaler.update(_check_X_y(X_chunk, _, dtype)[0])
+            self._set_scaler(scaler)
+        self._resolve_learning_rate(n_features, chunks)
+
+        # the sum over the chunks is float64 whatever the dtype
+        total = np.empty(self._theta.shape)
+        slopes = np.empty_like(self._theta)
+        buffers = {"residual": np.empty((0,) + target_shape, dtype=dtype)}
+
+        def epoch():
+            total[:] = 0
+            loss = 0.0
+            n_rows = 0
+            for X_chunk, y_chunk in chunks():
+                X_chunk, y_chunk = _check_X_y(X_chunk, y_chunk, dtype)
+                if len(y_chunk) > len(buffers["residual"]):
+                    buffers["residual"] = np.empty(y_chunk.shape, dtype=dtype)
+                residual = buffers["residual"][:len(y_chunk)]
+                loss += self._loss_slopes(X_chunk, y_chunk, self._theta, residual, slopes)
+                np.add(total, slopes, out=total)
+                n_rows += len(y_chunk)
+            slopes[:] = total
+            loss, sq_slopes = self._update(loss, slopes, n_rows, n_rows)
+            return loss, np.sqrt(sq_slopes)
+
+        self._run(epoch, full_batch=True)
+        self._set_attributes()
+        return self
+
+    def save(self, path):
+        """
+        Write m, b, the optimizer state, the epoch count, the shuffling state and
+        stats_ to the .npz file `path`. The file is written next to path first and
+        then renamed, so a run killed while saving leaves the last checkpoint intact.
+
+        """
+        if getattr(self, "_theta", None) is None:
+            raise ValueError("nothing to save, fit the model first")
+        state = {"theta": self._theta, "params": self._params, "epochs_done": self._epochs_done,
+                 # NaN for a learning rate that was never needed (solver="normal", "cd")
+                 "step_size": _nan_if_none(self._step_size),
+                 "learning_rate": _nan_if_none(self._base_lr),
+                 "auto_learning_rate": _nan_if_none(self._auto_lr),
+                 "rng": json.dumps(self._rng.bit_generator.state),
+                 "optimizer": type(self._optimizer).__name__}
+        for name in self._optimizer._state:  # not its settings, nor the scratch _tmp
+            state["optimizer." + name] = getattr(self._optimizer, name)
+        if getattr(self, "stats_", None) is not None:
+            for name, value in vars(self.stats_).items():
+                state["stats." + name] = value
+        if self._scaler is not None:
+            for name, value in vars(self._scaler).items():
+                state["scaler." + name] = value
+        tmp = "%s.tmp" % path
+        with open(tmp, "wb") as f:
+            np.savez(f, **state)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """
+        Read a checkpoint written by save. partial_fit carries on from it,
+        and so do fit and fit_stream with warm_start=True.
+        The settings (learning_rate, optimizer, ...) are not in the checkpoint,
+        they come from this regressor. Only the estimate of learning_rate="auto" is
+        kept, so it is not made again.
+
+        """
+        with np.load(path) as data:
+            self._theta = data["theta"]
+            self._check_params()
+            self._scaler = None
+            self._params = self._theta
+            if "scaler.n" in data.files:
+                self._scaler = _Scaler(len(self._theta) - 1)
+                self._params = data["params"]
+            self._optimizer = _make_optimizer(self.optimizer, self._params)
+            if type(self._optimizer).__name__ != str(data["optimizer"]):
+                raise ValueError("the checkpoint was saved with optimizer %s, this regressor uses %s"
+                                 % (data["optimizer"], type(self._optimizer).__name__))
+            self.stats_ = None
+            if "stats.n" in data.files:
+                self.stats_ = _SufficientStats(len(self._theta) - 1)
+            for key in data.files:
+                group, _, name = key.partition(".")
+                value = data[key]
+                value = value.item() if value.ndim == 0 else value
+                if group == "optimizer" and name in self._optimizer._state:
+                    setattr(self._optimizer, name, value)
+                elif group == "stats":
+                    setattr(self.stats_, name, value)
+                elif group == "scaler":
+                    setattr(self._scaler, name, value)
+            self._epochs_done = int(data["epochs_done"])
+            self._step_size = _none_if_nan(data["step_size"])
+            self._base_lr = _none_if_nan(data["learning_rate"])
+            self._auto_lr = _none_if_nan(data["auto_learning_rate"])
+            self._rng = np.random.default_rng()
+            self._rng.bit_generator.state = json.loads(str(data["rng"]))
+        # the learning_rate of this regressor, the checkpoint's only for "auto"
+        self._apply_learning_rate()
+        self._lr = self._current_learning_rate()
+        self._set_attributes()
+        return self
+
+    def _scratch(self, name, shape, dtype):
+        "a buffer kept between calls, predict and score allocate nothing once it is big enough"
+        if not hasattr(self, "_buffers"):
+            self._buffers = {}
+        size = int(np.prod(shape))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = self._buffers[name] = np.empty(size, dtype=dtype)
+        return buffer[:size].reshape(shape)
+
+    def predict(self, X, out=None, chunk_size=_PREDICT_ROWS):
+        """
+        X @ coef_ + intercept_, computed chunk_size rows at a time.
+
+        X can be an array, a np.memmap, a path to a .npy file or a sparse matrix.
+        out is an array of n_samples rows ((n_samples, n_targets) for several targets)
+        with the dtype of coef_ to write the predictions into, so a loop over batches
+        of rows allocates nothing. When at most half of the features have a non zero
+        slope (L1 penalty) only those columns of X are used.
+
+        """
+        if getattr(self, "_theta", None) is None:
+            raise ValueError("the model is not fitted yet, call fit first")
+        X = _open_array(X)
+        if not _issparse(X) and np.ndim(X) == 1:
+            X = np.reshape(X, (-1, 1))
+        n_samples = X.shape[0]
+        if X.shape[1] != len(self._theta) - 1:
+            raise ValueError("X has %d features, the model was fitted with %d"
+                             % (X.shape[1], len(self._theta) - 1))
+        dtype = self._theta.dtype
+        shape = (n_samples,) + self._theta.shape[1:]
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif out.shape != shape or out.dtype != dtype:
+            raise ValueError("out must be a %s array of shape %s" % (dtype, shape))
+        coef, intercept = self._theta[:-1], self._theta[-1]
+        # the features with a non zero slope for at least one target
+        keep = np.flatnonzero(coef.reshape(len(coef), -1).any(axis=1))
+        gather = not _issparse(X) and len(keep) <= len(coef) // 2
+        if gather:
+            coef = coef[keep]
+
+        for start in range(0, n_samples, chunk_size):
+            X_chunk = X[start:start + chunk_size]
+            out_chunk = out[start:start + chunk_size]
+            if _issparse(X):
+                out_chunk[:] = X_chunk @ coef
+            else:
+                if X_chunk.dtype != dtype:
+                    X_chunk = X_chunk.astype(dtype)
+                if gather:
+                    columns = self._scratch("columns", (len(X_chunk), len(keep)), dtype)
+                    X_chunk = np.take(X_chunk, keep, axis=1, out=columns)
+                np.dot(X_chunk, coef, out=out_chunk)
+            out_chunk += intercept
+        return out
+
+    def score(self, X, y, chunk_size=_PREDICT_ROWS):
+        """
+        R^2 = 1 - sum((y - y_pred)**2) / sum((y - mean(y))**2), like sklearn's r2_score,
+        averaged over the targets for a 2d y (multioutput="uniform_average").
+
+        One pass over X and y, chunk_size rows at a time : the predictions of a chunk
+        go into a buffer that is kept between calls and only the sums are kept,
+        added up in float64 (the sum for mean(y) chunk by chunk, like _Scaler).
+
+        """
+        if getattr(self, "_theta", None) is None:
+            raise ValueError("the model is not fitted yet, call fit first")
+        X, y = _open_array(X), _open_array(y)
+        if not _target_shape(np.shape(y)):
+            y = np.ravel(y)
+        n_samples = len(y)
+        if X.shape[0] != n_samples:
+            raise ValueError("X has %d rows but y has %d" % (X.shape[0], n_samples))
+        if y.shape[1:] != self._theta.shape[1:]:
+            raise ValueError("y has %d targets, the model was fitted with %d"
+                             % ((y.shape[1:] or (1,))[0], (self._theta.shape[1:] or (1,))[0]))
+        buffer = self._scratch("predictions", (min(chunk_size, n_samples),) + y.shape[1:],
+                               self._theta.dtype)
+        ss_res = ss_tot = mean_y = 0.0
+        count = 0
+        for start in range(0, n_samples, chunk_size):
+            y_chunk = y[start:start + chunk_size]
+            tmp = buffer[:len(y_chunk)]
+            self.predict(X[start:start + chunk_size], out=tmp, chunk_size=chunk_size)
+            np.subtract(y_chunk, tmp, out=tmp)
+            ss_res += _sum_sq64(tmp)
+            # mean and squared deviations of this chunk, merged into the totals
+            chunk_mean = y_chunk.mean(axis=0, dtype=np.float64)
+            np.subtract(y_chunk, chunk_mean, out=tmp)
+            delta = chunk_mean - mean_y
+            total = count + len(y_chunk)
+            ss_tot += _sum_sq64(tmp) + delta * delta * count * len(y_chunk) / total
+            mean_y += delta * len(y_chunk) / total
+            count = total
+        # a constant target scores 1 when it is predicted exactly, else 0
+        constant = ss_tot == 0
+        r2 = np.where(constant, ss_res == 0, 1 - ss_res / np.where(constant, 1, ss_tot))
+        return float(np.mean(r2))
+
+
+def gd_sweep(X, y, learning_rates, epochs):
+    """
+    Batch GD for every combination of learning_rates x epochs at once.
+
+    Returns a dict of arrays with one row per combination :
+    learning_rate, epochs, coef (n_features per row), intercept,
+    loss (at the last epoch) and loss_curve (one value per epoch, nan after
+    the run's last epoch). Runs that blow up end with inf or nan instead
+    of stopping the others.
+
+    """
+    X, y = _check_X_y(X, y)
+    if y.ndim != 1:
+        raise ValueError("gd_sweep fits a single target, y must be 1d, got shape %s"
+                         % (y.shape,))
+    n_samples, n_features = X.shape
+    rates = np.unique(np.asarray(learning_rates, dtype=np.float64))
+    epochs = np.unique(np.asarray(epochs, dtype=np.int64))
+    if len(rates) == 0 or len(epochs) == 0 or epochs[0] < 1:
+        raise ValueError("need at least one learning rate and epochs >= 1")
+    K = len(rates)
+
+    # same starting point as GDRegressor
+    M = np.full((K, n_features), 100.0)
+    B = np.full(K, -120.0)
+
+    R = np.empty((n_samples, K))
+    slopes_M = np.empty((K, n_features))
+    curve = np.empty((K, epochs[-1]))
+    snapshots = {}
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        for i in range(epochs[-1]):
+            _matvec(X, M.T, R)
+            np.subtract(y[:, None], R, out=R)
+            R -= B
+            np.einsum("ij,ij->j", R, R, out=curve[:, i])
+            if _issparse(X):
+                slopes_M[:] = (X.T @ R).T
+            else:
+                np.dot(R.T, X, out=slopes_M)
+            slopes_M *= -2
+            slopes_B = -2 * R.sum(axis=0)
+
+            M -= rates[:, None] * slopes_M
+            B -= rates * slopes_B
+            if i + 1 in epochs:
+                snapshots[i + 1] = (M.copy(), B.copy())
+
+    table = {"learning_rate": np.tile(rates, len(epochs)),
+             "epochs": np.repeat(epochs, K),
+             "coef": np.concatenate([snapshots[e][0] for e in epochs]),
+             "intercept": np.concatenate([snapshots[e][1] for e in epochs]),
+             "loss": np.concatenate([curve[:, e - 1] for e in epochs]),
+             "loss_curve": np.full((K * len(epochs), epochs[-1]), np.nan)}
+    for j, e in enumerate(epochs):
+        table["loss_curve"][j * K:(j + 1) * K, :e] = curve[:, :e]
+    return table
+
+
+class DescentPlot:
+    """
+    Callback for GDRegressor (single feature) that moves one line while GD runs.
+
+    every : redraw every k-th epoch only
+    ax : axes to draw in, a new figure if None
+    headless : draw on an Agg canvas that never opens a window (servers, dashboards),
+               use save(path) to get the picture
+
+    replay(history) draws the line for the rows of a finished run's history_.
+
+    """
+
+    def __init__(self, X, y, every=1, ax=None, headless=False):
+        X = np.asarray(X)
+        if X.ndim == 2 and X.shape[1] != 1:
+            raise ValueError("DescentPlot draws a line, X must have a single feature")
+        self.every = every
+        if ax is None:
+            if headless:
+                from matplotlib.backends.backend_agg import FigureCanvasAgg
+                from matplotlib.figure import Figure
+
+                figure = Figure()
+                FigureCanvasAgg(figure)
+            else:
+                import matplotlib.pyplot as plt
+
+                figure = plt.figure()
+            ax = figure.add_subplot()
+        self.ax = ax
+        self.x_ends = np.array([X.min(), X.max()])
+        ax.scatter(X.ravel(), np.ravel(y), s=10)
+        self.line, = ax.plot(self.x_ends, [np.nan, np.nan], color="red")
+        ax.set_ylim(*self._y_range(y))
+
+    @staticmethod
+    def _y_range(y):
+        low, high = np.min(y), np.max(y)
+        pad = 0.1 * (high - low)
+        return low - pad, high + pad
+
+    def draw(self, m, b, label=None):
+        self.line.set_ydata(m * self.x_ends + b)
+        if label is not None:
+            self.ax.set_title(label)
+        canvas = self.ax.figure.canvas
+        canvas.draw_idle()
+        canvas.flush_events()
+
+    def __call__(self, regressor, epoch, loss, slope_norm):
+        if epoch % self.every == 0:
+            theta = regressor._theta
+            self.draw(theta[0], theta[-1], "epoch %d, loss %.4g" % (epoch, loss))
+
+    def replay(self, history):
+        for row in history[::self.every]:
+            self.draw(row["params"][0], row["params"][-1],
+                      "epoch %d, loss %.4g" % (row["epoch"], row["loss"]))
+
+    def save(self, path):
+        self.ax.figure.savefig(path)
+
+
+class Checkpoint:
+    """
+    Callback that saves the regressor to `path` every `every` epochs.
+    A long run that gets killed loses at most `every` epochs :
+
+    gd = GDRegressor(..., warm_start=True, callback=Checkpoint("gd.npz"))
+    if os.path.exists("gd.npz"):
+        gd.load("gd.npz")
+    gd.fit(X, y)
+
+    """
+
+    def __init__(self, path, every=10):
+        self.path = path
+        self.every = every
+
+    def __call__(self, regressor, epoch, loss, slope_norm):
+        if epoch % self.every == 0 and np.isfinite(loss):
+            regressor.save(self.path)
+
+
+_BENCHMARK_SOLVERS = {
+    "gd": {},
+    "armijo": {"line_search": "armijo"},
+    "stats": {"solver": "stats"},
+    "normal": {"solver": "normal"},
+}
+
+
+def benchmark(path="gd_benchmark.json", n_samples=(1_000, 10_000, 100_000, 1_000_000, 10_000_000),
+              n_features=(1, 10, 100, 1000), solvers=None, epochs=1000, tol=1e-6,
+              max_bytes=2 ** 30, random_state=13, cache=None):
+    """
+    Fit GDRegressor on a grid of make_regression sizes and write the results to `path`.
+
+    solvers : name -> GDRegressor keyword arguments, _BENCHMARK_SOLVERS by default.
+              learning_rate defaults to "auto", 1 / L from the data.
+    cache : a DatasetCache, so the data is generated only on the first run
+    Returns the list of records that was written.
+
+    """
+    import platform
+
+    from sklearn.datasets import make_regression
+    from sklearn.linear_model import LinearRegression
+    from sklearn.metrics import r2_score
+
+    solvers = _BENCHMARK_SOLVERS if solvers is None else solvers
+    records = []
+    for n in n_samples:
+        for d in n_features:
+            cell = {"n_samples": int(n), "n_features": int(d)}
+            if 8 * n * d > max_bytes:
+                records.extend(dict(cell, solver=name, skipped=True) for name in solvers)
+                continue
+            generate = make_regression if cache is None else cache.make_regression
+            X, y = generate(n_samples=n, n_features=d, noise=20, random_state=random_state)
+            r2_reference = r2_score(y, LinearRegression().fit(X, y).predict(X))
+
+            for name, params in solvers.items():
+                params = dict({"learning_rate": "auto", "epochs": epochs, "tol": tol,
+                               "record_every": None}, **params)
+                gd = GDRegressor(**params)
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", RuntimeWarning)  # diverged_ says it
+                    start = time.perf_counter()
+                    gd.fit(X, y)
+                    seconds = time.perf_counter() - start
+                    # tracemalloc slows down every allocation, so the memory comes from a
+                    # second fit and the time from the untraced one above
+                    tracing = tracemalloc.is_tracing()
+                    if not tracing:
+                        tracemalloc.start()
+                    tracemalloc.reset_peak()
+                    in_use = tracemalloc.get_traced_memory()[0]
+                    GDRegressor(**params).fit(X, y)
+                    peak_bytes = tracemalloc.get_traced_memory()[1] - in_use
+                    if not tracing:
+                        tracemalloc.stop()
+
+                records.append(dict(
+                    cell, solver=name, skipped=False,
+                    params={k: v for k, v in params.items() if np.isscalar(v) or v is None},
+                    seconds=seconds, epochs=gd.n_iter_,
+                    epochs_per_second=gd.n_iter_ / seconds if gd.n_iter_ else None,
+                    converged=gd.converged_, diverged=gd.diverged_, peak_bytes=peak_bytes,
+                    r2=gd.score(X, y),
+                    r2_reference=float(r2_reference)))
+            del X, y
+
+    report = {"numpy": np.__version__, "python": platform.python_version(),
+              "machine": platform.platform(), "cpus": os.cpu_count(),
+              "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": records}
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+    return records
+
+
+def _fit_fold(args):
+    "fit one training set (in a worker process) : returns theta, held-out R^2 and epochs"
+    estimator, train, test = args
+    estimator._init_params(len(train.sum_X), estimator.dtype or np.float64,
+                           target_shape=np.shape(train.sum_y))
+    estimator._fit_stats(train)
+    return estimator._theta, test.r2(estimator._theta), estimator.n_iter_
+
+
+def cross_validate(estimator, X, y, cv=10, n_jobs=None):
+    """
+    k-fold cross validation of a GDRegressor, the folds are the same as the ones of
+    cross_val_score(estimator, X, y, scoring="r2", cv=cv) : cv blocks of rows in order.
+
+    X and y can be arrays, np.memmap's, .npy paths or a sparse X, they are read once.
+    solver="gd" is run as solver="stats", the same batch GD on the statistics.
+    n_jobs > 1 fits the folds in that many worker processes.
+
+    Returns a dict with one entry per fold for test_score (R^2 on the held-out fold,
+    averaged over the targets for a 2d y), coef, intercept and n_iter.
+
+    """
+    X, y = _open_array(X), _open_array(y)
+    target_shape = _target_shape(np.shape(y))
+    if not target_shape:
+        y = np.ravel(y)
+    n_samples = len(y)
+    if X.shape[0] != n_samples:
+        raise ValueError("X has %d rows but y has %d" % (X.shape[0], n_samples))
+    if not 2 <= cv <= n_samples:
+        raise ValueError("cv must be between 2 and n_samples, got %r" % (cv,))
+    if estimator.batch_size is not None:
+        raise ValueError("cross_validate fits on statistics, batch_size must be None")
+    estimator = copy.deepcopy(estimator)
+    estimator.warm_start = False
+    if estimator.solver == "gd":
+        estimator.solver = "stats"
+    n_features = X.shape[1] if len(X.shape) == 2 else 1
+
+    # fold sizes of sklearn's KFold : the first n_samples % cv folds get one more row
+    sizes = np.full(cv, n_samples // cv)
+    sizes[:n_samples % cv] += 1
+    bounds = np.concatenate([[0], np.cumsum(sizes)])
+    folds = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        stats = _SufficientStats(n_features, target_shape)
+        for X_chunk, y_chunk in _iter_chunks(X[start:stop], y[start:stop], _PREDICT_ROWS):
+            stats.update(*_check_X_y(X_chunk, y_chunk, estimator.dtype))
+        folds.append(stats)
+    total = sum(folds[1:], folds[0])
+
+    jobs = [(estimator, total - fold, fold) for fold in folds]
+    if n_jobs is not None and n_jobs > 1:
+        with multiprocessing.Pool(min(n_jobs, cv)) as pool:
+            results = pool.map(_fit_fold, jobs)
+    else:
+        results = [_fit_fold((copy.deepcopy(estimator), train, test))
+                   for _, train, test in jobs]
+    thetas = np.array([theta for theta, _, _ in results])
+    return {"test_score": np.array([score for _, score, _ in results]),
+            "coef": np.swapaxes(thetas[:, :-1], 1, -1), "intercept": thetas[:, -1],
+            "n_iter": np.array([n_iter for _, _, n_iter in results])}
+
+
+class DatasetCache:
+    """
+    On-disk cache of make_regression data and train_test_split splits.
+
+    Every entry is a folder of .npy files named by a hash of what made it : the
+    function, its arguments (the seed included) and the sklearn version, and for a split
+    the content of the arrays that were split (arrays that came from this cache are known
+    by their entry and position in it, others are hashed). Entries are opened with mmap_mode="r", so
+    nothing is read until it is used and processes using the same entry share the pages.
+    When the cache grows over max_bytes the least recently used entries are deleted.
+    Calls without an int random_state are not repeatable and are not cached.
+
+    """
+
+    def __init__(self, directory, max_bytes=2 ** 32):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._keys = {}  # id of an array we returned -> (weak reference, entry key/index)
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def _hash(*parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=repr).encode()).hexdigest()
+
+    def _array_key(self, a):
+        known = self._keys.get(id(a))
+        if known is not None and known[0]() is a:
+            return known[1]
+        a = np.asarray(a)
+        h = hashlib.sha256(("%s %s" % (a.dtype.str, a.shape)).encode())
+        for start in range(0, len(a), _BLOCK_ROWS):
+            h.update(np.ascontiguousarray(a[start:start + _BLOCK_ROWS]).data)
+        return h.hexdigest()
+
+    def _params_key(self, params):
+        "params with every array (e.g. stratify=labels) replaced by its _array_key, not its repr"
+        return {name: value if value is None or np.isscalar(value) else self._array_key(value)
+                for name, value in params.items()}
+
+    def _load(self, key):
+        path = os.path.join(self.directory, key)
+        if not os.path.isdir(path):
+            return None
+        os.utime(path)  # most recently used
+        n_arrays = len([name for name in os.listdir(path) if name.endswith(".npy")])
+        return tuple(np.load(os.path.join(path, "%d.npy" % i), mmap_mode="r")
+                     for i in range(n_arrays))
+
+    def _store(self, key, arrays):
+        # written to a temporary folder and renamed, so nobody sees half an entry
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        for i, a in enumerate(arrays):
+            np.save(os.path.join(tmp, "%d.npy" % i), a)
+        try:
+            os.rename(tmp, os.path.join(self.directory, key))
+        except OSError:
+            shutil.rmtree(tmp)  # another process stored the same entry first
+        self._evict(keep=key)
+
+    def _evict(self, keep):
+        "delete the least recently used entries until the cache fits in max_bytes"
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((os.stat(path).st_mtime, size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name != keep:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+                total -= size
+
+    def get(self, name, params, make):
+        "the tuple of arrays make() returns, read from the cache when name and params were seen"
+        key = self._hash(name, params)
+        arrays = self._load(key)
+        if arrays is None:
+            self._store(key, make())
+            arrays = self._load(key)
+        # every array by its own key, X and y of one entry are not the same data
+        for i, a in enumerate(arrays):
+            self._keys[id(a)] = (weakref.ref(a), "%s/%d" % (key, i))
+        return arrays
+
+    def make_regression(self, **params):
+        "sklearn's make_regression(**params), cached"
+        import sklearn
+        from sklearn.datasets import make_regression
+
+        if not isinstance(params.get("random_state"), (int, np.integer)):
+            return make_regression(**params)
+        return self.get("make_regression", dict(params, sklearn=sklearn.__version__),
+                        lambda: make_regression(**params))
+
+    def train_test_split(self, *arrays, **params):
+        "sklearn's train_test_split(*arrays, **params), cached"
+        import sklearn
+        from sklearn.model_selection import train_test_split
+
+        if not isinstance(params.get("random_state"), (int, np.integer)):
+            return train_test_split(*arrays, **params)
+        keys = [self._array_key(a) for a in arrays]
+        return list(self.get("train_test_split", dict(self._params_key(params), arrays=keys,
+                                                       sklearn=sklearn.__version__),
+                             lambda: train_test_split(*arrays, **params)))
@@ -637,6 +637,604 @@ gd.fit(X,y)
 "We can see, it easily converges at epochs= 50 as well"
 
 
+"--------------------------------------------------------------------------------"
+
+"Code for n features - m becomes a vector of slopes, one per column of X"
+
+import os
+import tempfile
+import time
+
+from gdcore import (Checkpoint, DatasetCache, DescentPlot, GDRegressor, cross_validate,
+                    gd_sweep)
+
+"""
+With X of shape (n_samples, n_features) the two loss slopes become
+
+loss_slope_b = -2 * sum(y - X @ m - b)
+loss_slope_m = -2 * X.T @ (y - X @ m - b)
+
+Both use the same residual r = y - X @ m - b, so we compute r only ONCE per epoch
+and get the slopes for every feature from a single matrix-vector product X.T @ r.
+
+m and b are kept together in one parameter vector theta = [m_1 ... m_n, b],
+and the residual and the slopes are written into buffers that are allocated
+before the loop, so an epoch does not create any new array of size n_samples.
+
+GDRegressor and all the helpers used from here on live in gdcore.py, which only
+needs NumPy. Import them from there in your own code : importing this file runs
+the whole walk through, sklearn fits and plots included.
+
+"""
+
+
+gd = GDRegressor(0.001, 100)
+
+gd.fit(X, y)
+print(gd.coef_, gd.intercept_)
+
+"output is the same as the single feature version : slope 27.82 and intercept -2.29"
+
+"Now with 3 features"
+
+X3, y3 = make_regression(n_samples=100,
+                         n_features=3,
+                         n_informative=3,
+                         n_targets=1,
+                         noise=20,
+                         random_state=13)
+
+gd = GDRegressor(0.001, 100)
+gd.fit(X3, y3)
+print("GD", gd.coef_, gd.intercept_)
+
+reg = LinearRegression().fit(X3, y3)
+print("OLS", reg.coef_, reg.intercept_)
+
+"the slopes and the intercept found by GD match the ones from OLS"
+
+"Mini-batch GD : update m and b after every 10 rows instead of after all 100"
+
+gd = GDRegressor(0.001, 100, batch_size=10, random_state=2)
+gd.fit(X3, y3)
+print("mini-batch GD", gd.coef_, gd.intercept_)
+
+"Stochastic GD : update after every single row"
+
+gd = GDRegressor(0.001, 100, batch_size=1, random_state=2)
+gd.fit(X3, y3)
+print("SGD", gd.coef_, gd.intercept_)
+
+"""
+each update only looks at one batch, so it costs O(batch_size) instead of O(n_samples).
+As the slopes now come from a part of the data the line wobbles around the OLS answer
+instead of sliding into it, and the smaller the batch the bigger the wobble.
+"""
+
+"When the data is bigger than memory : save it as .npy and stream it from disk"
+
+with tempfile.TemporaryDirectory() as tmp:
+    np.save(os.path.join(tmp, "X3.npy"), X3)
+    np.save(os.path.join(tmp, "y3.npy"), y3)
+
+    gd = GDRegressor(0.001, 100)
+    gd.fit_stream(os.path.join(tmp, "X3.npy"), os.path.join(tmp, "y3.npy"), chunk_size=25)
+    print("streamed GD", gd.coef_, gd.intercept_)
+
+"""
+the files are opened with mmap_mode="r" and read 25 rows at a time,
+so only one chunk is in memory, and the answer is the same as gd.fit(X3, y3)
+
+If the chunks come from somewhere else (a database, many files ...)
+pass a function that returns an iterator of (X_chunk, y_chunk) instead,
+or call gd.partial_fit(X_chunk, y_chunk) for each chunk as it arrives.
+"""
+
+"Early stopping : 1000 epochs allowed, but stop once the loss stops improving"
+
+gd = GDRegressor(0.001, 1000, tol=1e-6)
+gd.fit(X3, y3)
+print("stopped after", gd.n_iter_, "epochs", gd.coef_, gd.intercept_)
+
+"And the learning rate of 0.1 from above is caught after a few epochs instead of blowing up"
+
+gd = GDRegressor(0.1, 1000)
+gd.fit(X3, y3)
+print("diverged :", gd.diverged_, "after", gd.n_iter_, "epochs")
+
+"""
+For the squared loss the slopes only depend on n, sum(X), sum(y), X.T @ X and X.T @ y.
+solver="stats" reads X once to get them and then every epoch is a few tiny
+(n_features x n_features) products, no matter how many rows there are.
+"""
+
+gd = GDRegressor(0.001, 100, solver="stats")
+gd.fit(X3, y3)
+print("GD on stats", gd.coef_, gd.intercept_)  # same as gd.fit above, without 100 passes over X
+
+"and from the same statistics we can get the exact OLS answer directly"
+
+gd = GDRegressor(0.001, 100, solver="normal")
+gd.fit(X3, y3)
+print("normal equations", gd.coef_, gd.intercept_)  # same as LinearRegression
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Above we kept redefining GDRegressor and calling fit again to try
+learning rates of 0.1, 0.01, 0.001 and epochs of 10, 50, 100.
+
+Every one of those runs reads all of X in every epoch. Instead we can stack
+the m's and b's of K models into a (K, n_features) and a (K,) array and
+update all of them with ONE matrix product over X per epoch :
+
+R = y - X @ M.T - B          (n_samples, K), one residual column per model
+loss_slopes_M = -2 * R.T @ X
+loss_slopes_B = -2 * sum(R, axis=0)
+
+Also a run with 100 epochs passes through the 10 and 50 epoch answers on the way,
+so every learning rate only has to be run once, for the largest number of epochs.
+"""
+
+
+sweep = gd_sweep(X3, y3, learning_rates=[0.1, 0.01, 0.001], epochs=[10, 50, 100])
+
+for row in range(len(sweep["epochs"])):
+    print(sweep["learning_rate"][row], sweep["epochs"][row], sweep["loss"][row],
+          sweep["coef"][row], sweep["intercept"][row])
+
+"""
+9 models from 100 passes over X instead of 10+50+100 passes for each learning rate.
+with 3 features lr = 0.1 and lr = 0.01 both blow up, only lr = 0.001 gets to the OLS answer.
+"""
+
+"""
+On a machine with many cores, batch GD can split the rows between worker processes.
+Each worker computes the slopes of its own rows, and the parent adds them up.
+(for 100 rows this is of course slower than n_jobs=None, it pays off for millions of rows)
+"""
+
+# worker processes can't be started while this file is being imported (they would wait
+# forever for the import to finish), so this part only runs when the file is run as a script
+if __name__ == "__main__":
+    gd = GDRegressor(0.001, 100, n_jobs=2)
+    gd.fit(X3, y3)
+    print("GD with 2 workers", gd.coef_, gd.intercept_)
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Optimizers
+
+Make the features badly scaled : multiply the 2nd column by 10 and the 3rd by 100.
+The loss now changes 10,000 times faster along the 3rd slope than along the 1st,
+so plain GD needs a learning rate small enough for the 3rd column (or it blows up
+like lr = 0.1 did above) and then crawls along the 1st one.
+"""
+
+X_scaled = X3 * np.array([1, 10, 100])
+
+reg = LinearRegression().fit(X_scaled, y3)
+print("OLS", reg.coef_, reg.intercept_)
+
+gd = GDRegressor(4e-7, 1000)
+gd.fit(X_scaled, y3)
+print("plain GD", gd.coef_, gd.intercept_)  # still far away after 1000 epochs (needs ~100,000)
+
+gd = GDRegressor(50, 1000, optimizer="adagrad")
+gd.fit(X_scaled, y3)
+print("AdaGrad", gd.coef_, gd.intercept_)
+
+gd = GDRegressor(10, 1000, optimizer="adam")
+gd.fit(X_scaled, y3)
+print("Adam", gd.coef_, gd.intercept_)
+
+"""
+AdaGrad and Adam divide every step by the size of that parameter's own slopes,
+so each parameter moves at its own pace and both reach the OLS answer in 1000 epochs.
+(the learning rate now means roughly "how far a parameter may move per epoch")
+Momentum and Nesterov keep a running velocity that cancels the zig-zag, which helps
+when the learning rate is close to the limit, but not with this kind of bad scaling.
+"""
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Learning rate schedules and line search
+
+A schedule starts with a big learning rate and makes it smaller as the epochs go by,
+e.g. schedule="step" halves it every 10 epochs (decay_rate=0.5, decay_steps=10).
+
+With line_search="armijo" we do not have to pick the learning rate at all :
+every epoch tries a step, and halves it until the loss really goes down.
+For the squared loss trying a step does not need another pass over X, so an epoch
+still costs the same as a plain GD epoch.
+"""
+
+for lr in [0.1, 0.01, 0.001]:
+    gd = GDRegressor(lr, 1000, line_search="armijo", tol=1e-8)
+    gd.fit(X3, y3)
+    print("lr", lr, ": converged in", gd.n_iter_, "epochs", gd.coef_, gd.intercept_)
+
+"""
+lr = 0.1 diverged above and lr = 0.001 needed 100 epochs, with the line search
+all three land on the OLS answer in a few dozen epochs.
+"""
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Instead of print(loss_slope, self.b) inside the loop, every fit keeps a history_ :
+one row per epoch with the loss, the size of the slopes, the time the epoch took
+and the values of m and b after it.
+"""
+
+gd = GDRegressor(0.001, 100)
+gd.fit(X3, y3)
+
+print(gd.history_["loss"][[0, 9, 49, 99]])        # the loss after 1, 10, 50 and 100 epochs
+print(gd.history_["params"][-1])                  # m's and b at the end
+print(gd.history_["seconds"].sum(), "seconds in total")
+
+plt.figure()
+plt.plot(gd.history_["epoch"], gd.history_["loss"])
+plt.yscale("log")
+plt.xlabel("epoch")
+plt.ylabel("loss")
+
+"""
+the loss drops fast in the first ~20 epochs and is flat after ~50,
+which is the "it converges at epochs = 50 as well" from above, now as a picture.
+
+For very long runs use record_every=100 to keep every 100th epoch only, and
+callback=f to look at (or stop) the run while it is going.
+"""
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Watching the line move
+
+At the top we called plt.plot(X, y_pred) inside the epoch loop. Every call adds
+a new line to the figure and computes m * X + b for every point, so after 100
+epochs there are 100 lines, and drawing gets slower with every epoch.
+
+A straight line only needs its two end points, so DescentPlot keeps ONE line,
+computes it at min(X) and max(X) only, and moves it with set_ydata.
+It is a callback, so it sees every epoch but only redraws every `every` epochs.
+"""
+
+
+gd = GDRegressor(0.001, 100, callback=DescentPlot(X, y, every=10))
+gd.fit(X, y)
+
+"""
+the red line climbs from m=100, b=-120 onto the data, redrawn at epochs 10, 20 ... 100,
+and there is still only one line in the figure at the end.
+"""
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+float32
+
+make_regression gives float64 arrays, and numpy keeps everything float64.
+A float32 copy of X takes half the memory, and every epoch reads half as many bytes.
+GDRegressor keeps float32 data in float32 (m, b and all its buffers too),
+and only the big sums are added up in float64 so no accuracy is lost.
+"""
+
+X32, y32 = X3.astype(np.float32), y3.astype(np.float32)
+
+gd = GDRegressor(0.001, 100)
+gd.fit(X32, y32)
+print("float32", gd.coef_, gd.intercept_, gd.coef_.dtype)
+
+"same answer as the float64 fit above to ~6 digits, which is all float32 has"
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Sparse X
+
+One-hot or hashed features are mostly zeros. GDRegressor takes a scipy.sparse
+CSR or CSC matrix as it is : X @ m and X.T @ r are sparse products, and b is
+kept apart from X, so no dense copy of X is ever made.
+"""
+
+from scipy import sparse
+
+X_sparse = sparse.random(1000, 50, density=0.02, format="csr", random_state=13)
+y_sparse = X_sparse @ np.arange(50.0) + 5
+
+gd = GDRegressor(0.001, 1000, line_search="armijo")
+gd.fit(X_sparse, y_sparse)
+print("sparse", gd.coef_[:5], gd.intercept_)  # close to 0, 1, 2, 3, 4 and 5
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Warm start and checkpoints
+
+Above we refitted from scratch to see what 10, 50 and 100 epochs give.
+With warm_start=True every fit carries on from where the last one stopped,
+so going from 10 to 50 epochs costs 40 more epochs, not 50.
+"""
+
+gd = GDRegressor(0.001, 10, warm_start=True)
+gd.fit(X3, y3)
+print(gd.coef_, gd.intercept_)
+gd.epochs = 40
+gd.fit(X3, y3)
+print(gd.coef_, gd.intercept_)  # same as GDRegressor(0.001, 50).fit(X3, y3)
+
+"or start from somewhere better than m = 100, b = -120, e.g. a fit on a sample"
+
+gd = GDRegressor(0.001, 50)
+gd.fit(X3, y3, coef_init=np.zeros(3), intercept_init=y3.mean())
+print(gd.coef_, gd.intercept_)
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "gd.npz")
+    gd = GDRegressor(0.001, 30, optimizer="momentum", callback=Checkpoint(path))
+    gd.fit(X3, y3)  # stands in for a job that was stopped after 30 epochs
+
+    gd = GDRegressor(0.001, 20, optimizer="momentum", warm_start=True).load(path)
+    gd.fit(X3, y3)
+    print(gd.coef_, gd.intercept_)  # same as 50 epochs of momentum in one go, velocity included
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Benchmark
+
+"it easily converges at epochs = 50" is true for 100 rows and 1 feature.
+benchmark() fits every solver on make_regression data of every size in a grid
+and writes one JSON record per fit :
+
+time to tol (seconds), epochs and epochs per second, converged / diverged,
+peak_bytes (memory the fit allocated on top of X and y, from tracemalloc on a
+second fit, so the times are not slowed down by it)
+and R^2 on the training data next to the R^2 of LinearRegression.
+
+Run it before and after a change to the epoch loop and compare the two files.
+Sizes whose X would not fit in max_bytes are written as skipped, not run.
+"""
+
+"""
+e.g. a quick run over the small sizes only :
+
+benchmark("before.json", n_samples=(1_000, 10_000), n_features=(1, 10))
+"""
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Ridge, lasso and elastic net
+
+20 features of which only 3 matter. Plain GD gives every feature some small slope,
+the L1 penalty sets the useless ones to exactly 0, so predict can skip them.
+penalty="l2" with solver="normal" is sklearn's Ridge with the same alpha.
+"""
+
+X20, y20 = make_regression(n_samples=200, n_features=20, n_informative=3, noise=5,
+                           random_state=0)
+
+gd = GDRegressor(0.001, 500, tol=1e-10)
+gd.fit(X20, y20)
+print("no penalty, zero slopes :", np.sum(gd.coef_ == 0))
+
+gd = GDRegressor(0.001, 500, tol=1e-10, penalty="l1", alpha=2000.0)
+gd.fit(X20, y20)
+print("lasso, zero slopes :", np.sum(gd.coef_ == 0), "after", gd.n_iter_, "epochs")
+
+"coordinate descent gets the same answer in a few sweeps over the 20 slopes"
+
+gd = GDRegressor(0.001, 500, tol=1e-10, penalty="l1", alpha=2000.0, solver="cd")
+gd.fit(X20, y20)
+print("lasso (cd), zero slopes :", np.sum(gd.coef_ == 0), "after", gd.n_iter_, "epochs")
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Standardized features and the mean loss
+
+learning_rate=0.1 diverged at the start because the loss is a SUM over the rows, so
+its slopes grow with n_samples, and because every feature has its own scale
+(X_scaled above is the worst case). standardize=True runs GD as if every column
+were (x - mean) / std, and loss_reduction="mean" divides the loss by n.
+Then the same learning rate works whatever n_samples and the units of X are,
+and coef_ / intercept_ still come out in the units of X_scaled.
+"""
+
+gd = GDRegressor(0.5, 1000, tol=1e-10, standardize=True, loss_reduction="mean")
+gd.fit(X_scaled, y3)
+print(gd.coef_, gd.intercept_, "after", gd.n_iter_, "epochs")  # same as LinearRegression
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+predict and score
+
+GDRegressor now has what the start of this file promised : fit AND predict.
+Both go over X chunk_size rows at a time, so X can be a memmap of any size.
+predict can write into a buffer we pass in (out=), and score computes R^2
+from running sums without ever holding all the predictions.
+"""
+
+from sklearn.metrics import r2_score
+
+gd = GDRegressor(0.5, 1000, tol=1e-10, standardize=True, loss_reduction="mean")
+gd.fit(X3, y3)
+y_pred = np.empty(len(y3))
+gd.predict(X3, out=y_pred, chunk_size=32)
+print(gd.score(X3, y3, chunk_size=32), r2_score(y3, y_pred))  # the same R^2
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Cross validation
+
+cross_val_score(lr, X, y, scoring='r2', cv=10) refits on 9/10 of the data 10 times,
+and for GD every one of those fits reads its 9/10 of X once per epoch.
+cross_validate reads X once : it makes the statistics of every fold, and the
+statistics of a training set are the total minus its held-out fold. The fits then
+run on the statistics only and the held-out R^2 comes from the fold's statistics.
+"""
+
+
+from sklearn.model_selection import cross_val_score
+
+print(np.mean(cross_val_score(LinearRegression(), X3, y3, scoring="r2", cv=10)))
+print(np.mean(cross_validate(GDRegressor(0.001, 1, solver="normal"), X3, y3)["test_score"]))
+print(np.mean(cross_validate(GDRegressor(0.5, 1000, tol=1e-10, standardize=True,
+                                         loss_reduction="mean"), X3, y3)["test_score"]))
+
+if __name__ == "__main__":
+    scores = cross_validate(GDRegressor(0.001, 1, solver="normal"), X3, y3, n_jobs=2)
+    print("cross validation with 2 workers", np.mean(scores["test_score"]))
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Learning rate from the data
+
+The loss is a parabola in m and b, and how curved it is comes straight from X :
+its Hessian is 2 * [[sum(X*X), sum(X)], [sum(X), n]] for one feature. With L its
+largest eigenvalue, GD diverges for learning rates above 2 / L (that is what
+happened with 0.1 at the start) and 1 / L is a safe and fast choice.
+learning_rate="auto" computes it before the first epoch.
+"""
+
+gd = GDRegressor("auto", 100, tol=1e-12)
+gd.fit(X, y)
+print(gd.learning_rate_, gd.n_iter_, gd.coef_, gd.intercept_)  # 27.82 and -2.29 in 15 epochs
+
+"""
+The penalty is part of the Hessian too (2 * alpha for every m), and it is not divided
+by n for loss_reduction="mean", so "auto" also works for a penalized mean loss.
+"""
+
+gd = GDRegressor("auto", 1000, tol=1e-12, loss_reduction="mean", penalty="l2", alpha=10)
+gd.fit(X3, y3)
+print(gd.converged_, gd.diverged_)  # True False
+
+"""
+A mini-batch is steeper than its share of the whole Hessian : one row alone has
+2 * (|x|**2 + 1). With batch_size "auto" bounds L by the largest row, so SGD is
+stable too, on rows of any size.
+"""
+
+X_sgd, y_sgd = make_regression(n_samples=2000, n_features=10, noise=1, random_state=0)
+for loss_reduction in ("sum", "mean"):
+    gd = GDRegressor("auto", 30, batch_size=1, random_state=0, loss_reduction=loss_reduction)
+    gd.fit(X_sgd, y_sgd)
+    print(gd.learning_rate_, gd.diverged_, np.isfinite(gd.coef_).all())  # ... False True
+
+"""
+line_search="exact" goes further : along the slopes the loss is a parabola in the
+step t too, so every epoch can take the step to its lowest point.
+"""
+
+gd = GDRegressor(0.001, 100, tol=1e-12, line_search="exact")
+gd.fit(X, y)
+print(gd.n_iter_, gd.coef_, gd.intercept_)
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Dataset cache
+
+make_regression(..., random_state=13) and train_test_split(..., random_state=2) give
+the same arrays every time, so there is no need to make them again in every run.
+"""
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    cache = DatasetCache(tmp, max_bytes=2 ** 20)
+    for run in range(2):
+        start = time.perf_counter()
+        X_c, y_c = cache.make_regression(n_samples=10_000, n_features=3, noise=20, random_state=13)
+        X_train, X_test, y_train, y_test = cache.train_test_split(X_c, y_c, test_size=0.2,
+                                                                   random_state=2)
+        # the second run reads both from the cache (memmaps, nothing is read yet)
+        print("run", run, type(X_train).__name__, time.perf_counter() - start, "seconds")
+    del X_c, y_c, X_train, X_test, y_train, y_test  # close the memmaps before tmp goes
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Many targets at once
+
+With many y's for the same X, one GDRegressor per target reads X again for every
+target. A 2d Y (one column per target) is fitted in one go : m becomes a matrix
+with one column per target, the residuals R = Y - X @ M - b are a matrix too and
+the slopes of every target come from one product X.T @ R, so every epoch reads X
+twice whatever the number of targets.
+"""
+
+X_t, Y_t = make_regression(n_samples=10_000, n_features=20, n_targets=200, noise=20,
+                           random_state=13)
+
+start = time.perf_counter()
+gd = GDRegressor("auto", 100, tol=1e-10).fit(X_t, Y_t)
+print("200 targets at once", time.perf_counter() - start, "seconds", gd.coef_.shape)
+
+start = time.perf_counter()
+for target in range(Y_t.shape[1]):
+    GDRegressor("auto", 100, tol=1e-10).fit(X_t, Y_t[:, target])
+print("one model per target", time.perf_counter() - start, "seconds")
+
+lr = LinearRegression().fit(X_t, Y_t)
+print(np.abs(gd.coef_ - lr.coef_).max(), np.abs(gd.intercept_ - lr.intercept_).max())
+print(gd.score(X_t, Y_t), lr.score(X_t, Y_t))
+
+
+"-------------------------------------------------------------------------------"
+
+"""
+Where does the time of an epoch go ?
+
+profile=True times every phase of every epoch : the residual (one read of X),
+X.T @ r (the other read), the two sums, the update of m and b, and the rest.
+bytes_per_second of the two reads next to the memory bandwidth of the machine tells
+if the epochs are bound by memory, a big share for "other" or "update" means Python
+overhead (tiny data, mini-batches), and profile="memory" shows which phase allocates.
+"""
+
+gd = GDRegressor("auto", 100, profile=True)
+gd.fit(X_t, Y_t[:, 0])
+for name, phase in gd.profile_["phases"].items():
+    print("%-10s %5.1f%%" % (name, 100 * phase["share"]),
+          "%.2g bytes/s" % phase["bytes_per_second"] if "bytes_per_second" in phase else "")
+
+gd = GDRegressor(1e-4, 5, batch_size=10, random_state=0, profile="memory")
+gd.fit(X_t, Y_t[:, 0])
+print(gd.profile_["phases"]["other"]["share"], gd.profile_["phases"]["update"]["peak_bytes"])
+
+"""
+with 10,000 rows and 20 features the two reads of X take most of the time. With
+batch_size=10 the same epoch is 1000 tiny updates, and Python takes over.
+"""
+
+
 """
 Blog for learning more on GD :
     https://developers.google.com/machine-learning/crash-course/linear-regression/gradient-descent